@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#Copyright (c) 2014 Loek Wensveen
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+""" Benchmark for ConfigFile.read.
+
+Generates a config file and reads it with the current parser and with the
+parser settingslib used before (a copy is kept below, `OldConfigFile`).
+Prints the best time of both and checks they create the same tree.
+
+Usage::
+
+    python benchmarks/configfile_parser.py [lines] [runs]
+"""
+
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settingslib.configfile import ConfigFile
+
+class OldConfigFile(ConfigFile):
+    """ ConfigFile reading files with the previous, line by line regex, parser."""
+    def read(self, fp):
+        for v in self.keys()[:]:
+            del self[v]
+            
+        self.read_helper(OldPushBackFile(fp), "")
+
+    def read_helper(self, fp, indent):
+        key = None
+        
+        for line in fp:
+            mat = re.match(r'([ \t]*)(.*)$', line)
+            left, right = mat.groups()
+            
+            if not right:
+                continue
+            elif len(left) < len(indent):
+                fp.push(line)
+                return
+            elif len(left) > len(indent):
+                if not key:
+                    raise ValueError, "Extra indent, but no lastkey, line %d" % fp.lineno
+                self[key.strip()] += " %s" % right
+            elif right[-1:] == ':':
+                section = right[:-1].strip()
+                if not section:
+                    raise ValueError, "Empty section, line %d" % fp.lineno
+                cfg = self[section] = OldConfigFile()
+                while True:
+                    newline = fp.next(stack=False)
+                    fp.push(newline)
+                    if newline.strip() and not newline.strip().startswith("#"):
+                        break
+                if newline:
+                    mat = re.match(r'([ \t]*)', newline)
+                    if len(mat.group(0)) > len(indent):
+                        cfg.read_helper(fp, mat.group(0))
+            else:
+                if '=' in right:
+                    key, val = right.split('=', 1)
+                else:
+                    key, val = right, ""
+                self[key.strip()] = val.strip()
+
+class OldPushBackFile(object):
+    def __init__(self, fp):
+        self.fp = fp
+        self.stack = []
+        self.lineno = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self, stack=True):
+        while True:
+            if self.stack and stack:
+                line = self.stack.pop()
+            else:
+                line = self.fp.next()
+            if line.strip()[:1] != "#":
+                break
+        self.lineno += 1
+        line = self.untab(line.rstrip())
+        return line
+
+    def push(self, line):
+        if line:
+            self.lineno -= 1
+        self.stack.insert(0,line)
+
+    def untab(self, line):
+        newline = []
+        line = list(line)
+        while line:
+            c = line[0]
+            del line[0]
+            if c == " ":
+                newline.append(" ")
+            elif c == "\t":
+                newline.append(" ")
+                while len(newline) % 4:
+                    newline.append(" ")
+            else:
+                newline.append(c)
+                newline.extend(line)
+                line = []
+        return "".join(newline)
+
+def generate(lines):
+    """ Returns a config file of about ``lines`` lines, with nested sections, comments and tabs."""
+    out = []
+    n = 0
+    while len(out) < lines:
+        out.append("# comment for section %d" % n)
+        out.append("section%d:" % n)
+        for i in range(20):
+            out.append("    key%d = some value %d for section %d" % (i, i, n))
+        out.append("    long = first part")
+        out.append("        second part")
+        out.append("\tsubsection:")
+        out.append("\t\tdeep = value")
+        out.append("")
+        out.append("\t\t# comment")
+        out.append("\t\tother = value %d" % n)
+        out.append("top%d = %d" % (n, n))
+        n += 1
+    # the old parser fails if the file ends with an empty section
+    return "\n".join(out) + "\n"
+
+def tree(cfg):
+    """ Returns the config as nested lists, so the order of keys is compared too."""
+    return [(key, tree(value) if isinstance(value, ConfigFile) else value) for key, value in cfg.items()]
+
+def main(lines=50000, runs=3):
+    data = generate(lines)
+    
+    def read(cls):
+        cfg = cls()
+        cfg.read(StringIO.StringIO(data))
+        return cfg
+    
+    if tree(read(ConfigFile)) != tree(read(OldConfigFile)):
+        print "The parsers do not create the same tree!"
+        sys.exit(1)
+    
+    print "ConfigFile.read, {} lines, best of {} runs".format(data.count("\n"), runs)
+    for name, cls in [('old', OldConfigFile), ('new', ConfigFile)]:
+        seconds = min(timeit.repeat(lambda: read(cls), number=1, repeat=runs))
+        print "  {} : {:.3f} s".format(name, seconds)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#Copyright (c) 2014 Loek Wensveen
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+""" Benchmark for the import time of settingslib.
+
+Imports settingslib in a new interpreter a number of times and prints the
+best and average time. Also prints the settingslib modules and some of the
+heavier standard library modules that are loaded by the import, the 
+resolvers should only be loaded when the first settingsobject is created.
+
+Usage::
+
+    python benchmarks/import_time.py [runs]
+"""
+
+from __future__ import absolute_import
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WATCHED = ['settingslib.resolvers', 'inspect', 'json', 'hashlib', 'base64', 'datetime']
+
+SCRIPT = """
+import sys, time
+start = time.time()
+import settingslib
+import settingslib.basesettings
+end = time.time()
+first = [m for m in %(watched)r if m in sys.modules]
+class Settings(settingslib.basesettings.BaseSettings):
+    SOMETHING = 1
+Settings()
+second = [m for m in %(watched)r if m in sys.modules]
+print repr((end - start, first, second))
+"""
+
+def run():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % {'watched' : WATCHED}], env=env)
+    return eval(output)
+
+def main(runs=20):
+    times = []
+    for i in range(runs):
+        seconds, loaded, created = run()
+        times.append(seconds)
+    print "import settingslib, {} runs".format(runs)
+    print "  best    : {:.2f} ms".format(min(times) * 1000)
+    print "  average : {:.2f} ms".format(sum(times) / len(times) * 1000)
+    print "  loaded after import          : {}".format(", ".join(loaded) or "-")
+    print "  loaded after first settings  : {}".format(", ".join(created) or "-")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -33,6 +33,6 @@ from  logging import NullHandler
 logger = logging.getLogger(__name__)
 logger.addHandler(NullHandler())
 
-# make sure all resolvers are loaded
-import settingslib.resolvers
+# the resolvers are loaded the first time they are needed,
+# see settingslib.basesettings.load_resolvers
 
@@ -26,21 +26,72 @@
 
 from __future__ import absolute_import
 
+import atexit
+import collections
 import logging
 import os
+import sys
+import threading
 
 from . import configfile
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['Option', 'Resolver', 'BaseSettings', 'Section',
-            'SettingsException', 'add_resolver_type']
+# depth of nested formatted values that are not cached, after which the
+# references are resolved without recursion, see `BaseSettings._get_formatted`
+MAX_NESTING = 32
+
+# value of a setting that could not be looked up, see `BaseSettings.reload`
+UNRESOLVED = object()
+
+__all__ = ['Option', 'Resolver', 'BaseSettings', 'Section', 'FrozenSection',
+            'FrozenDict', 'SettingsException', 'add_resolver_type']
 
 class SettingsException(Exception):
     pass
             
 def add_resolver_type(cls):
     Section._resolverTypes.append(cls)
+    Section._resolverIndex = None
+
+def add_builtin_resolver_types(classes):
+    """ Adds the resolver types of settingslib before all other resolver types.
+    
+    Used by `settingslib.resolvers`, that module is only imported when
+    the first resolver is needed (see `load_resolvers`). Resolver types
+    added with `add_resolver_type` before that still override the builtin ones.
+    """
+    Section._resolverTypes[0:0] = classes
+    Section._resolverIndex = None
+
+def load_resolvers():
+    """ Imports the builtin resolvers, if not done yet.
+    
+    Importing settingslib does not import the resolvers, they are
+    imported the first time a schema or resolver is needed.
+    """
+    if 'settingslib.resolvers' not in sys.modules:
+        from . import resolvers
+    
+class HelpDict(object):
+    """ Descriptor holding the help messages of the attrs of a settings class.
+    
+    The attr string literals are only read from the source of the module
+    the first time the help_dict of a class is used. Help messages passed 
+    to an `Option` override them.
+    """
+    def __get__(self, instance, owner):
+        help_dict = owner.__dict__.get('_help_dict')
+        if help_dict is None:
+            module = sys.modules.get(owner.__module__)
+            keys = [key.upper() for key in owner.defaults]
+            help_dict = {}
+            if module is not None:
+                for key, doc in get_attr_doc_form_class(owner.__name__, module, keys).items():
+                    help_dict[key.lower()] = doc
+            help_dict.update(owner.option_help)
+            owner._help_dict = help_dict
+        return help_dict
     
 class Section(object):
     """ Section class used to create Sections in a Settings object.
@@ -70,7 +121,9 @@ class Section(object):
                 " SECTION_ATTR is a attr of the section, it can be acces by settings.SECTION.SECTION_ATTR"
     
     Sections are automatic created by the SectionSettingsResolver. Sections are
-    recreated each time they are accessed. 
+    created the first time they are accessed and reused after that, until
+    a layer of the parent changes the section. Set ``max_sections`` to limit
+    the number of child sections a section keeps alive.
 
     :param root: The root BaseSettings instance (settingsobject). they are passed to the resolvers
     :param options: A dict representing options passed by the commandline. if a '.' is in the key
@@ -87,6 +140,15 @@ class Section(object):
     :type nosave: `dict`
     :type envconfig: `dict`
     :type configs: `list` containing `dict`
+    
+    Set ``use_cache`` to True on a settings class to cache resolved values.
+    A cached value is stored on the instance, so the next read of that
+    attribute is a plain attribute lookup. Cached values are dropped as soon
+    as a layer that can change them is changed (``__setattr__``, ``__delattr__``,
+    ``set_options``, ``set_userfile`` and ``add_cfgfile``). Values that depend
+    on other settings (like string formatting) are cached too, the root keeps
+    track of the references between settings and drops the values depending on
+    a changed setting.
     """
     class __metaclass__(type):
         """ This metaclass handles the creating of the settings class
@@ -103,10 +165,11 @@ class Section(object):
         This allows things like nosave attrs or solid values (default 
         always returned).
         
-        It also creates the help_dict. this dict contains all help 
-        messages for the attrs. Attr string literals are supported.
-        the help message are also added to the userconfigfile. this
-        makes it more clear if the user trys to read the file.
+        It also creates the option_help dict, the help messages passed to
+        `Option` objects. Together with the attr string literals they form
+        the help_dict (see `HelpDict`). the help message are also added to
+        the userconfigfile. this makes it more clear if the user trys to 
+        read the file.
         """
         def __new__(cls, name, bases, attrs):
             if name in ['Section', 'BaseSettings']:
@@ -115,11 +178,7 @@ class Section(object):
             defaults = {}
             resolvers = {}
             extraOptions = {}
-            
-            try:
-                help_dict = dict((k.lower(), v) for k,v in get_attr_doc_form_class(name, attrs['__module__']))
-            except:
-                help_dict = {}
+            help_dict = {}
             
             for key, value in attrs.items():
                 if key.isupper():
@@ -137,7 +196,7 @@ class Section(object):
             
             attrs['defaults'] = defaults
             attrs['raw_resolvers'] = resolvers
-            attrs['help_dict'] = help_dict
+            attrs['option_help'] = help_dict
             attrs['raw_extraOptions'] = extraOptions
             
             return type.__new__(cls, name, bases,attrs)
@@ -152,7 +211,12 @@ class Section(object):
     }
     
     _resolverTypes = []
+    _resolverIndex = None
+    help_dict = HelpDict()
     use_env = True
+    use_cache = False
+    max_sections = None
+    _path = ''
 
     def __init__(self, root, options, userconfig, nosave, envconfig ,configs):
         
@@ -170,7 +234,8 @@ class Section(object):
                 
         
         self.userconfig = userconfig
-        userconfig.set_help(None, self.__doc__)
+        if not userconfig.help():
+            userconfig.set_help(None, self.__doc__)
         
         self.nosave = nosave
         
@@ -185,25 +250,18 @@ class Section(object):
                 self.envconfig[key] = value
         
         self.fileconfigs = configs
+        
+        # key --> (layer, raw value) of the layer that holds the key first
+        self._index = {}
+        # key --> child section, oldest first
+        self._sections = collections.OrderedDict()
 
-        self.extraOptions = {}
-        for key in self.raw_extraOptions.keys():
-            self.extraOptions[key.lower()] = dict(self._defaultExtraOptions)
-            self.extraOptions[key.lower()].update(self.raw_extraOptions[key.lower()])
+        schema = self._get_schema()
+        self.extraOptions = schema.extraOptions
+        self.resolvers = ResolverDict(self, schema.resolvers)
         
-        self.resolvers = {}
-        for key, resolver in self.raw_resolvers.items():
-            if resolver is not None:
-                r = self._get_resolver(resolver.type,key=None, default=None, kwargs=resolver.resolverKwargs)
-            else:
-                r = self._get_resolver(self.defaults[key.lower()].__class__, key=key.lower(), default=self.defaults[key.lower()])
-            self.resolvers[key.lower()] = r
-            
-            if r.multivalue and not r.has_childs():
-                r.set_childs(self.defaults[key.lower()])
-            
-        for key, default in self.defaults.items():
-            self.extraOptions[key.lower()]['initialize'](key, default)
+        for key, initialize in schema.initialize:
+            initialize(key, self.defaults[key])
         
         
     
@@ -221,6 +279,9 @@ class Section(object):
         to True in the extraOptions the default is 
         returned.
         
+        The layer that holds a key is remembered in an index, the layers
+        are only searched again after one of them changed for that key.
+        
         Getattr is only called if the key is not found in __dict__
         """
         if not key.isupper():
@@ -228,12 +289,27 @@ class Section(object):
         key = key.lower()
 
         if self.extraOptions[key]['solid'] is True:
-            return self.defaults[key]
+            value = self.defaults[key]
+            if self.use_cache:
+                self.__dict__[key.upper()] = value
+            return value
 
-        for setting in [self.options, self.userconfig, self.nosave, self.envconfig] + self.fileconfigs + [self.defaults]:
-            if key in setting.keys():
-                return self.resolvers[key].get(setting[key])
-        raise AttributeError("Key does not exists in Settings object, key : {key}".format(key=key))
+        root = self.root
+        invalidations = root._invalidations
+        setting, raw = self._entry(key)
+        
+        resolver = self.resolvers[key]
+        references = resolver.references(raw)
+        if references:
+            value = root._get_formatted(self, key, resolver, raw, references)
+        else:
+            value = resolver.get(raw)
+        if self.use_cache and resolver.cacheable(raw):
+            self.__dict__[key.upper()] = value
+        if root._invalidations != invalidations:
+            # a layer changed while the value was resolved (see `BaseSettings.reload`)
+            self._drop(key)
+        return value
     
     def __setattr__(self, key, value):
         """ Sets attr for a settings.
@@ -258,12 +334,12 @@ class Section(object):
             return object.__setattr__(self, key, value)
         if self.resolvers[key.lower()].validate(value):
             if self.extraOptions[key.lower()]['save'] is not False:
-                self.userconfig[key.lower()] = self.resolvers[key.lower()].raw(value)
-                self.userconfig.set_help(key.lower(), self.help(key.lower()))
+                self._store(key, self.resolvers[key.lower()].raw(value))
             else:
                 self.nosave[key.lower()] = value
         else:
             raise SettingsException("This value is not valid for this key, key : {key}, value : {value}, {resolver}".format(key=key,value=value,resolver=self))
+        self._invalidate(key)
         # call the callback after the setting is set.
         self.extraOptions[key.lower()]['callback'](key, value)
     
@@ -279,12 +355,13 @@ class Section(object):
         Default values can never be deleted.
         """
         if not key.isupper():
-            return object.__delattr__(self, key, value)
+            return object.__delattr__(self, key)
         key = key.lower()
         
-        for setting in [self.userconfig, self.nosave]:
-            if key in setting.keys():
-                del setting[key]
+        self._store(key, None)
+        if key in self.nosave:
+            del self.nosave[key]
+        self._invalidate(key)
     
     def get(self, key):
         """ Same as __getattr__ but key doesn't have to be uppercase.
@@ -297,10 +374,8 @@ class Section(object):
         :return: Returns value of the key, resolved by resolver.
         :rtype: Same as type of default
         """
-        settings = self
-        for k in key.split('.')[:-1]:
-            settings = settings.__getattr__(k.upper())
-        return settings.__getattr__(key.split('.')[-1].upper())
+        settings, key = self._find(key)
+        return getattr(settings, key)
     
     def set(self, key, value):
         """ Same as __setattr__ but key doesn't have to be uppercase.
@@ -312,10 +387,8 @@ class Section(object):
         :param key: The key to set, dots allowed.
         :type key: ``str``
         """
-        settings = self
-        for k in key.split('.')[:-1]:
-            settings = settings.__getattr__(k)
-        settings.__setattr__(key.split('.')[-1].upper(), value)
+        settings, key = self._find(key)
+        setattr(settings, key, value)
     
     def has(self, key):
         """ Check if a settingsobject has a key.
@@ -335,15 +408,7 @@ class Section(object):
         :return: Returns True if key in settingsobject else False
         :rtype: `bool`
         """
-        try:
-            settings = self
-            for k in key.split('.')[:-1]:
-                settings = settings.defaults[k]
-            key = key.split('.')[-1]
-            
-            return key in settings.defaults
-        except AttributeError:
-            return False
+        return key.lower() in self._get_paths()
     
     def delele(self, key, options=False, env=False, fileconfig=False, runtime=True):
         """ Same as ``__delattr__`` but key doesn't have to be uppercase.
@@ -355,6 +420,11 @@ class Section(object):
         You can pass extra kwargs specify form with configdict
         the key must be deleted. the following kwargs are valid.
         
+        The key is deleted from each selected layer of the section holding
+        it, so ``delele('section.hello', fileconfig=True)`` also removes
+        ``hello`` from the section of every file config. The file configs
+        are only changed in memory, the files are not written.
+        
         :param key: The key to delete, dots allowed.
         :param options: If set to True key will be delete from commandline options
         :param env: If set to True key will be deleted from enviroment set config
@@ -366,23 +436,24 @@ class Section(object):
         :type fileconfig: `bool`
         :type runtime: `bool`
         """
-        settings = self
-        for k in key.split('.')[:-1]:
-            settings = settings.get(k)
+        settings, key = self._find(key)
+        key = key.lower()
         
         settingslist = []
         if runtime:
-            settingslist.extend([self.userconfig, self.nosave])
+            settings._store(key, None)
+            settingslist.append(settings.nosave)
         if options:
-            settingslist.append(self.options)
+            settingslist.append(settings.options)
         if env:
-            settingslist.append(self.envconfig)
+            settingslist.append(settings.envconfig)
         if fileconfig:
-            settingslist.extend(self.fileconfigs)
+            settingslist.extend(settings.fileconfigs)
         
-        for setting in [self.userconfig, self.nosave]:
-            if key in setting.keys():
+        for setting in settingslist:
+            if key in setting:
                 del setting[key]
+        settings._invalidate(key)
 
     def keys(self):
         """ Returns all key of settingsobject.
@@ -407,10 +478,7 @@ class Section(object):
         :return: list of values of settingsobject
         :rtype: ``list``
         """
-        values = []
-        for key in self.keys():
-            values.append(self.get(key))
-        return values
+        return [value for key, value in self.items()]
     
     def items(self):
         """ Returns tulpes of (key, value) of all settings in settingsobject.
@@ -418,12 +486,31 @@ class Section(object):
         Same as ``dict.items()``
         
         Does return sections, does not returns key or values of sections.
-        All values are resolved by the resolver
+        All values are resolved by the resolver, references shared by
+        the values are only resolved once.
         
         :return: list of values of settingsobject
         :rtype: ``list`` of key, value tuples
         """
-        return [(key, self.get(key)) for key in self.keys()]
+        memo = {}
+        return [(key, self._get_shared(key, memo)) for key in self.keys()]
+    
+    def iter_items(self):
+        """ Iterates over all settings in the settingsobject and its sections.
+        
+        Yields tuples of (dotted path, value), the path is lowercase and 
+        relative to this section so ``self.get(path)`` returns the value.
+        Sections are not yielded, their settings are. The settings are 
+        walked once, references shared by values are only resolved once
+        during the iteration. Changes made while iterating may not be seen
+        by values that reference the changed setting.
+        
+        :return: Iterator of (path, value) tuples
+        :rtype: ``generator``
+        """
+        for prefix, key, value in self._walk():
+            if not isinstance(value, Section):
+                yield prefix + key.lower(), value
     
     def sections(self):
         """ Returns all keys of sections in settingsobject.
@@ -434,7 +521,7 @@ class Section(object):
         :return: list of key if the key is a section
         :rtype: ``list``
         """
-        return [key.upper() for key, value in self.defaults.keys() if issubclass(value, Section)]
+        return [key.upper() for key, value in self.defaults.items() if isinstance(value, type) and issubclass(value, Section)]
     
     def help(self, key=None):
         """ This function will return help messages for an attr of for the settingsobject itself.
@@ -449,16 +536,14 @@ class Section(object):
         """
         if key is None:
             return self.__doc__ or None
-        for k in key.split('.')[:-1]:
-            settings = settings.__getattr__(k.upper())
-        lkey = key.split('.')[-1].lower()
-        if lkey.upper() in settings.sections():
-            return settings.get(lkey).help()
-        else:
-            try:
-                return self.help_dict[lkey]
-            except KeyError:
-                return None
+        try:
+            parents, key, cls = self._get_paths()[key.lower()]
+        except KeyError:
+            return None
+        default = cls.defaults[key.lower()]
+        if isinstance(default, type) and issubclass(default, Section):
+            return default.__doc__ or None
+        return cls.help_dict.get(key.lower())
 
     def get_dict(self):
         """ Function to get a compleet dict of a settingsobject.
@@ -471,23 +556,221 @@ class Section(object):
         :rtype: ``dict``
         """
         d = {}
-        for key, value in self.items():
+        # prefix of a section --> dict of that section
+        dicts = {'' : d}
+        for prefix, key, value in self._walk():
             if isinstance(value, Section):
-                d[key] = value.get_dict()
+                dicts[prefix + key.lower() + '.'] = dicts[prefix][key] = {}
             else:
-                d[key] = value
+                dicts[prefix][key] = value
         return d
     
+    def freeze(self):
+        """ Returns an immutable snapshot of the settingsobject.
+        
+        All values are resolved once, sections are frozen too. Reading 
+        a value of the snapshot is a plain attribute lookup. Changes made
+        to the settingsobject later are not seen by the snapshot, call
+        ``freeze`` again to get a new one.
+        
+        :return: Snapshot of the settingsobject
+        :rtype: `FrozenSection`
+        """
+        return FrozenSection(self)
+    
+    def _find(self, key):
+        """ Internal function to find the section holding the dotted path ``key``.
+        
+        :return: The section and the uppercase key in that section.
+        :rtype: ``tuple``
+        """
+        try:
+            parents, key, cls = self._get_paths()[key.lower()]
+        except KeyError:
+            raise AttributeError("Key does not exists in Settings object, key : {key}".format(key=key))
+        settings = self
+        for k in parents:
+            settings = getattr(settings, k)
+        return settings, key
+    
+    @classmethod
+    def _get_paths(cls):
+        """ Internal function returning the paths of all settings of this class, including
+        the settings of (sub)sections.
+        
+        The paths are build once per class from the defaults of the class and its sections.
+        
+        :return: Dict lowercase dotted path --> (uppercase keys of the sections on the path,
+                uppercase key, class holding the key)
+        :rtype: ``dict``
+        """
+        schema = cls._get_schema()
+        if schema.paths is None:
+            paths = {}
+            classes = [((), '', cls)]
+            while classes:
+                parents, prefix, owner = classes.pop()
+                for key, default in owner.defaults.items():
+                    paths[prefix + key] = (parents, key.upper(), owner)
+                    if isinstance(default, type) and issubclass(default, Section):
+                        classes.append((parents + (key.upper(),), prefix + key + '.', default))
+            schema.paths = paths
+        return schema.paths
+    
+    def _layers(self):
+        """ Internal function returning all layers in the order they are searched."""
+        return [self.options, self.userconfig, self.nosave, self.envconfig] + self.fileconfigs + [self.defaults]
+    
+    def _lookup(self, key):
+        """ Internal function to find the first layer holding ``key``.
+        
+        :return: The layer and the raw value found in that layer
+        :rtype: ``tuple``
+        """
+        for setting in self._layers():
+            if key in setting:
+                return setting, setting[key]
+        raise AttributeError("Key does not exists in Settings object, key : {key}".format(key=key))
+    
+    def _entry(self, key):
+        """ Internal function returning the layer and raw value of ``key`` from the index.
+        
+        If the key is not in the index it is looked up and added, unless
+        something was invalidated during the lookup.
+        """
+        try:
+            return self._index[key]
+        except KeyError:
+            pass
+        invalidations = self.root._invalidations
+        entry = self._index[key] = self._lookup(key)
+        if self.root._invalidations != invalidations:
+            self._index.pop(key, None)
+        return entry
+    
+    def _invalidate(self, *keys):
+        """ Internal function to drop the cached values and index entries of ``keys``.
+        
+        Must be called each time a layer changes the value of a key, after the change.
+        """
+        # counted first, so a lookup that ran before the change sees it (see `_entry`)
+        self.root._invalidations += 1
+        for key in keys:
+            self._drop(key)
+        self.root._invalidate_dependents([self._join(key.lower()) for key in keys])
+    
+    def _drop(self, key):
+        """ Internal function to drop the cached value, index entry and section of ``key``."""
+        self.__dict__.pop(key.upper(), None)
+        self._index.pop(key.lower(), None)
+        self._sections.pop(key.lower(), None)
+    
+    def is_dirty(self):
+        """ Check if a setting of this section was set or deleted at runtime since the userconfig file was read or saved.
+        
+        Settings of subsections count too, settings that are not saved
+        (see the ``save`` extra option) do not.
+        
+        :return: Returns True if the userconfig must be saved
+        :rtype: ``bool``
+        """
+        return self.userconfig.is_dirty()
+    
+    def _store(self, key, raw):
+        """ Internal function to set the runtime value of ``key`` in the userconfig.
+        
+        If ``raw`` is None the key is deleted. The change is appended to the
+        journal and the autosave thread is woken, see `BaseSettings.use_journal`
+        and `BaseSettings.autosave_interval`. The lock of the root is only held
+        while the userconfig changes.
+        """
+        key = key.lower()
+        root = self.root
+        with root._lock:
+            if raw is not None:
+                self.userconfig[key] = raw
+                self.userconfig.set_help(key, self.help(key))
+            elif key in self.userconfig:
+                del self.userconfig[key]
+            else:
+                return
+            full = root._journal is not None and root._append_journal(self._join(key), raw)
+        if root._autosaver is not None:
+            root._autosaver.notify()
+        elif full:
+            root.save()
+    
+    def _walk(self):
+        """ Internal function walking the settingsobject and its sections once.
+        
+        Yields (prefix, uppercase key, value) tuples, a section is yielded 
+        before its settings. The prefix is the lowercase dotted path of the
+        section holding the key relative to this section, ending in a dot.
+        """
+        memo = {}
+        stack = [('', self)]
+        while stack:
+            prefix, section = stack.pop()
+            for key in section.keys():
+                value = section._get_shared(key, memo)
+                yield prefix, key, value
+                if isinstance(value, Section):
+                    stack.append((prefix + key.lower() + '.', value))
+    
+    def _get_shared(self, key, memo):
+        """ Internal function to get the value of ``key`` sharing resolved references.
+        
+        While the value is resolved, references are looked up in ``memo``
+        first (see `BaseSettings._reference`). The value is added to ``memo``
+        so other values referencing it don't resolve it again.
+        """
+        state = self.root._state
+        previous, state.memo = state.memo, memo
+        try:
+            value = memo[self._join(key.lower())] = getattr(self, key)
+        finally:
+            state.memo = previous
+        return value
+    
+    def _join(self, key):
+        """ Internal function returning the full dotted path of ``key`` starting at the root."""
+        return self._path + '.' + key if self._path else key
+    
+    def _add_section(self, key, section):
+        """ Internal function to keep a child section for reuse.
+        
+        The section is also set on the instance so the next access is
+        a plain attribute lookup.
+        """
+        self._sections[key] = section
+        self.__dict__[key.upper()] = section
+        if self.max_sections is not None and len(self._sections) > self.max_sections:
+            old, _ = self._sections.popitem(last=False)
+            self.__dict__.pop(old.upper(), None)
+    
     def _get_resolver(self, type_=None, key=None, default=None ,kwargs={}):
         """ Internal function to get a resolver bases on type, key_name and default value."""
-        for cls in reversed(self._resolverTypes):
-            if cls.supports(type_, key, default):
-                return cls(self, **kwargs)
-        for subtype in type_.__mro__:
-            for cls in reversed(self._resolverTypes):
-                if cls.supports(subtype, key, default):
-                    return cls(self, **kwargs)
-        return self._get_resolver('default', kwargs=kwargs)
+        return self._find_resolver(type_, key, default)(self, **kwargs)
+    
+    @classmethod
+    def _find_resolver(cls, type_=None, key=None, default=None):
+        """ Internal function to find the resolver class bases on type, key_name and default value."""
+        if Section._resolverIndex is None:
+            load_resolvers()
+            Section._resolverIndex = ResolverIndex(cls._resolverTypes)
+        return Section._resolverIndex.find(type_, key, default)
+    
+    @classmethod
+    def _get_schema(cls):
+        """ Internal function to get the compiled `Schema` of this class.
+        
+        The schema is compiled by the first instance and shared by all
+        other instances. It is compiled again if resolver types are added.
+        """
+        schema = cls.__dict__.get('_schema')
+        if schema is None or schema.generation != len(cls._resolverTypes):
+            schema = cls._schema = Schema(cls)
+        return schema
 
 class BaseSettings(Section):
     """ The base class for a settingsobject.
@@ -549,13 +832,56 @@ class BaseSettings(Section):
             with this preflix. if found they are use to override
             the default values. if the key includes a dot ist mean
             the this value override a value of a Section.
-    :param cfgfiles: A list of dict like objects. they are used 
+    :param cfgfiles: A list of config file locations. they are used 
             to override the default settings. You can pass as many
-            dicts a you like.
+            files a you like. A file is only read the first time
+            one of its keys is looked up.
     :type env_preflix: ``str``
     :type cfgfiles: ``list``
+    
+    Set ``cfgfile_cache`` on the settings class to cache the parsed config 
+    files. If True the cache is stored next to each config file, if a 
+    directory is given the cache files are stored in that directory. A 
+    cached file is only parsed again after it changed.
+    
+    Set ``use_journal`` to True to append each setting set or deleted at
+    runtime to a journal next to the userconfig file (the userfile with 
+    ``.journal`` appended). The journal is replayed by `set_userfile`, so
+    runtime changes survive a crash without saving. Once the journal is 
+    larger than ``journal_size`` bytes it is folded into the userconfig 
+    file, see `save`.
+    
+    Set ``autosave_interval`` to a number of seconds to save the userconfig
+    file in a background thread, at most once per interval. Setting a value
+    never waits for the disk. The changes that are not saved yet are saved
+    when the application exits or `stop_autosave` is called.
+    
+    Set ``watch_interval`` to a number of seconds to reload the config files
+    that changed in a background thread, see `reload`. The files are checked
+    each interval, and on Linux also as soon as their directory changes.
     """
+    cfgfile_cache = None
+    use_journal = False
+    journal_size = 64 * 1024
+    autosave_interval = None
+    watch_interval = None
+    _journal = None
+    _autosaver = None
+    _watcher = None
+    
     def __init__(self, env_preflix=None, cfgfiles=()):
+        # held while the userconfig changes, and by save while reading it
+        self._lock = threading.RLock()
+        # only one save at a time
+        self._save_lock = threading.Lock()
+        # path --> paths of the cached values that reference it
+        self._dependents = {}
+        # incremented by each invalidation, see `Section._entry`
+        self._invalidations = 0
+        # per thread, paths of the formatted values that are being resolved
+        self._state = ResolveState()
+        self._check_references()
+        
         options = {}
 
         userconfig = configfile.ConfigFile()
@@ -566,17 +892,171 @@ class BaseSettings(Section):
         if self.use_env and env_preflix:
             for key, value in os.environ.items():
                 if key.startswith(env_preflix):
-                    self.envconfig[key[len(env_preflix):].lower()] = value
+                    envconfig[key[len(env_preflix):].lower()] = value
                     
         self.cfgfiles = list(cfgfiles)
         fileconfigs = []
         for file in cfgfiles:
-            with open(file, 'r') as fd:
-                config = configfile.ConfigFile(False)
-                config.read(fd)
-                fileconfigs.append(config)
+            fileconfigs.append(configfile.LazyConfigFile(file, self.cfgfile_cache))
         
         super(BaseSettings, self).__init__(self, options, userconfig, nosave, envconfig, fileconfigs)
+        
+        if self.watch_interval is not None:
+            from .watcher import Watcher
+            self._watcher = Watcher(self.reload, lambda: list(self.cfgfiles), self.watch_interval)
+    
+    def _reference(self, key):
+        """ Internal function used by resolvers to get the value of a referenced setting.
+        
+        During a bulk resolution (see `Section.items` and `Section.iter_items`)
+        referenced values are shared between the values being resolved.
+        """
+        memo = self._state.memo
+        if memo is None:
+            return self.get(key)
+        key = key.lower()
+        try:
+            return memo[key]
+        except KeyError:
+            value = memo[key] = self.get(key)
+            return value
+    
+    def _get_formatted(self, section, key, resolver, raw, references):
+        """ Internal function to resolve a value that references other settings.
+        
+        If the section caches values the references are resolved first, deepest
+        reference first (see `_prepare`), so formatting never recurses deep. The 
+        references are recorded so the value is dropped when one of them changes.
+        Values that are not cached are formatted recursively until they are 
+        nested ``MAX_NESTING`` deep, then the rest of the chain is resolved the
+        same way and kept in a memo of the thread until the value is resolved.
+        
+        :raises SettingsException: If the value (indirectly) references itself.
+        """
+        path = section._join(key)
+        state = self._state
+        resolving = state.resolving
+        if path in resolving:
+            raise SettingsException("Circular reference in settings, key : {key}".format(key=path))
+        resolving.add(path)
+        cache = section.use_cache and resolver.cacheable(raw)
+        deep = not cache and len(resolving) > MAX_NESTING
+        outer = deep and state.memo is None
+        if outer:
+            state.memo = {}
+        try:
+            if cache:
+                self._add_dependencies(path, references)
+                self._prepare(references)
+            elif deep:
+                self._prepare(references, state.memo)
+            return resolver.get(raw)
+        finally:
+            resolving.discard(path)
+            if outer:
+                state.memo = None
+    
+    def _prepare(self, paths, memo=None):
+        """ Internal function to resolve and cache ``paths`` and all settings they reference.
+        
+        Uses a stack instead of recursion, a setting is resolved after all settings it
+        references are resolved. If ``memo`` is given the values are also stored in 
+        it, for settings that are not cached (see `_reference`). Otherwise the 
+        references of values that are not cached are recorded too, so the cached 
+        values that reach a setting through them are dropped when it changes.
+        """
+        stack = [(path.lower(), False) for path in paths]
+        seen = set()
+        while stack:
+            path, ready = stack.pop()
+            section, key = self._find(path)
+            if ready:
+                value = getattr(section, key)
+                if memo is not None:
+                    memo[path] = value
+                continue
+            if path in seen or key in section.__dict__ or (memo is not None and path in memo):
+                continue
+            seen.add(path)
+            key = key.lower()
+            if section.extraOptions[key]['solid'] is True:
+                continue
+            setting, raw = section._entry(key)
+            resolver = section.resolvers[key]
+            references = resolver.references(raw)
+            if references:
+                if memo is None and not (section.use_cache and resolver.cacheable(raw)):
+                    self._add_dependencies(path, references)
+                stack.append((path, True))
+                stack.extend((reference.lower(), False) for reference in references if reference.lower() not in seen)
+    
+    def _add_dependencies(self, path, references):
+        """ Internal function to record that the value of ``path`` depends on ``references``.
+        
+        The value also depends on the sections holding the references.
+        """
+        for reference in references:
+            parts = reference.lower().split('.')
+            for i in range(1, len(parts) + 1):
+                self._dependents.setdefault('.'.join(parts[:i]), set()).add(path)
+    
+    def _invalidate_dependents(self, paths):
+        """ Internal function to drop the cached values that (indirectly) depend on ``paths``."""
+        self._invalidations += 1
+        stack = list(paths)
+        while stack:
+            for path in self._dependents.pop(stack.pop(), ()):
+                section = self
+                parts = path.split('.')
+                for part in parts[:-1]:
+                    section = section._sections.get(part)
+                    if section is None:
+                        break
+                else:
+                    section.__dict__.pop(parts[-1].upper(), None)
+                stack.append(path)
+    
+    def _check_references(self):
+        """ Internal function to check the defaults for circular references.
+        
+        :raises SettingsException: If a default (indirectly) references itself.
+        """
+        schema = self._get_schema()
+        if schema.checked:
+            return
+        
+        graph = {}
+        classes = [('', self.__class__)]
+        while classes:
+            path, cls = classes.pop()
+            for key, references in cls._get_schema().references.items():
+                graph[path + key] = [reference.lower() for reference in references]
+            for key, default in cls.defaults.items():
+                if isinstance(default, type) and issubclass(default, Section):
+                    classes.append((path + key + '.', default))
+        
+        # depth first search, a reference to a path on the stack is a cycle
+        done = set()
+        for start in graph:
+            if start in done:
+                continue
+            stack = [(start, iter(graph[start]))]
+            onstack = [start]
+            while stack:
+                path, references = stack[-1]
+                for reference in references:
+                    if reference in onstack:
+                        cycle = onstack[onstack.index(reference):] + [reference]
+                        raise SettingsException("Circular reference in settings : {cycle}".format(cycle=" -> ".join(cycle)))
+                    if reference not in done and reference in graph:
+                        stack.append((reference, iter(graph[reference])))
+                        onstack.append(reference)
+                        break
+                else:
+                    stack.pop()
+                    onstack.pop()
+                    done.add(path)
+        schema.checked = True
     
     def set_options(self, args):
         """ Set commandline options for the settingsobject.
@@ -589,6 +1069,7 @@ class BaseSettings(Section):
                 the return of argparse.ArgumentParser.parse_args() is 
                 supported.
         """
+        changed = list(self.options.keys())
         self.options.clear()
         options = args if  isinstance(args, dict) else vars(args)
         for key, value in options.items():
@@ -599,6 +1080,8 @@ class BaseSettings(Section):
                 self.options[dkey.lower()][key] = value
             else:
                 self.options[key.lower()] = value
+        changed.extend(self.options.keys())
+        self._invalidate(*changed)
     
     def set_userfile(self, userfile):
         """ Set the location of the userconfigfile
@@ -660,8 +1143,105 @@ class BaseSettings(Section):
         :type userfile: ``str``
         """
         self.userfile = userfile
-        with open(userfile, 'r') as fd:
-            self.userconfig.read(fd)
+        with self._lock:
+            changed = list(self.userconfig.keys())
+            self.userconfig.read_file(userfile)
+            full = self.use_journal and self._open_journal(userfile + '.journal')
+            changed.extend(self.userconfig.keys())
+        self._invalidate(*changed)
+        if full:
+            self.save()
+        if self.autosave_interval is not None and self._autosaver is None:
+            self._autosaver = Autosaver(self, self.autosave_interval)
+            atexit.register(self.stop_autosave)
+    
+    def stop_autosave(self):
+        """ Stop saving the userconfig file in the background.
+        
+        The changes that are not saved yet are saved before this returns.
+        """
+        autosaver, self._autosaver = self._autosaver, None
+        if autosaver is not None:
+            autosaver.stop()
+    
+    def _open_journal(self, path):
+        """ Internal function to replay the journal at ``path`` and open it for appending.
+        
+        A record that was not written completely is ignored and removed.
+        Returns True if the journal should be folded into the userconfig file.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        size = 0
+        if os.path.exists(path):
+            with open(path, 'r') as fp:
+                for line in fp:
+                    if not line.endswith('\n'):
+                        break
+                    size += len(line)
+                    try:
+                        self._replay(line[0], line[1:-1])
+                    except ValueError:
+                        continue
+        self._journal = open(path, 'a')
+        self._journal.truncate(size)
+        return size > self.journal_size
+    
+    def _replay(self, kind, record):
+        """ Internal function to apply one journal record to the userconfig."""
+        if kind == '=':
+            path, _, value = record.partition(' ')
+            value = value.decode('string_escape')
+        elif kind == '-':
+            path, value = record, None
+        else:
+            raise ValueError("Unknown journal record : {record}".format(record=record))
+        keys = path.split('.')
+        config = self.userconfig
+        for key in keys[:-1]:
+            config = config[key]
+            if not isinstance(config, configfile.ConfigFile):
+                raise ValueError("Not a section in the userconfig : {path}".format(path=path))
+        if value is not None:
+            config[keys[-1]] = value
+        elif keys[-1] in config:
+            del config[keys[-1]]
+    
+    def _append_journal(self, path, value):
+        """ Internal function to append a change of the userconfig to the journal.
+        
+        The record is flushed to disk before returning. A value of None
+        records that the key was deleted. Returns True if the journal should
+        be folded into the userconfig file.
+        """
+        if value is None:
+            record = "-{path}\n".format(path=path)
+        else:
+            record = "={path} {value}\n".format(path=path, value=str(value).encode('string_escape'))
+        journal = self._journal
+        journal.write(record)
+        journal.flush()
+        os.fsync(journal.fileno())
+        return os.fstat(journal.fileno()).st_size > self.journal_size
+    
+    def _drop_journal(self, size):
+        """ Internal function to remove the first ``size`` bytes of the journal.
+        
+        The records appended after them are kept.
+        """
+        with self._lock:
+            journal = self._journal
+            if os.fstat(journal.fileno()).st_size == size:
+                journal.truncate(0)
+                return
+            with open(journal.name, 'r') as fp:
+                fp.seek(size)
+                records = fp.read()
+            with configfile.atomic_file(journal.name) as fp:
+                fp.write(records)
+            journal.close()
+            self._journal = open(journal.name, 'a')
     
     def add_cfgfile(self, file):
         """ Add a config file to the config dicts
@@ -670,24 +1250,312 @@ class BaseSettings(Section):
         config dict are look up just before default are return
         and are the last possibility to override the defaults.
         
+        The file is read the first time one of its keys is looked up. If 
+        values are already looked up the file is read directly, so only
+        the values of the keys in the file are looked up again.
+        
         :param file: The locations of the config file
         :type file: ``str``
         """
         self.cfgfiles.insert(0, file)
-        with open(file, 'r') as fd:
-            config = configfile.ConfigFile()
-            config.read(fd)
-            self.fileconfigs.insert(0, config)
+        config = configfile.LazyConfigFile(file, self.cfgfile_cache)
+        self.fileconfigs.insert(0, config)
+        if self._index or self._sections:
+            self._invalidate(*config.keys())
+        
+    def reload(self):
+        """ Read the config files that changed since they were read again.
+        
+        Only the values of the keys that differ from the previous version of
+        a file are looked up again. The ``callback`` extra option is called 
+        for the settings whose value changed, also if they only reference a 
+        changed key. Files that are not read yet are skipped, they are read 
+        when one of their keys is looked up.
         
+        :return: The dotted paths of the keys that changed in the files
+        :rtype: ``list``
+        """
+        updates = []
+        for config in list(self.fileconfigs):
+            new = config.reload()
+            if new is not None:
+                paths = config.diff(new)
+                if paths:
+                    updates.append((config, new, paths))
+        if not updates:
+            return []
+        
+        changed = []
+        for config, new, paths in updates:
+            changed.extend('.'.join(path).lower() for path in paths)
+        
+        default = Section._defaultExtraOptions['callback']
+        callbacks = []
+        for path, (parents, key, cls) in self._get_paths().items():
+            callback = cls._get_schema().extraOptions[key.lower()]['callback']
+            if callback is not default and self._affected(path, changed):
+                callbacks.append((path, key, callback, self._value(path)))
+        
+        with self._lock:
+            for config, new, paths in updates:
+                config.update(new, paths)
+            for path in changed:
+                keys = path.split('.')
+                section = self
+                for key in keys[:-1]:
+                    section = section._sections.get(key)
+                    if section is None:
+                        break
+                if section is not None:
+                    section._invalidate(keys[-1])
+                else:
+                    self._invalidate_dependents([path])
+        
+        for path, key, callback, old in callbacks:
+            value, raw = self._value(path)
+            if value is not UNRESOLVED and raw != old[1]:
+                callback(key, value)
+        return changed
+    
+    def _affected(self, path, changed):
+        """ Internal function to check if the value of ``path`` may depend on one of the ``changed`` paths.
+        
+        The references of the raw values are followed without resolving them. If
+        a reference can not be followed the value is assumed to depend on it.
+        """
+        stack = [path]
+        seen = set()
+        while stack:
+            path = stack.pop()
+            for other in changed:
+                if path == other or path.startswith(other + '.') or other.startswith(path + '.'):
+                    return True
+            seen.add(path)
+            try:
+                section, key = self._find(path)
+                key = key.lower()
+                if section.extraOptions[key]['solid'] is True:
+                    continue
+                setting, raw = section._entry(key)
+                references = section.resolvers[key].references(raw)
+            except Exception:
+                return True
+            stack.extend(reference.lower() for reference in references if reference.lower() not in seen)
+        return False
+    
+    def _value(self, path):
+        """ Internal function to get the value of ``path`` and its raw value, or twice `UNRESOLVED` if looking it up fails.
+        
+        Values must be compared by their raw value, list and dict values
+        are wrappers that are only equal to themselves.
+        """
+        try:
+            section, key = self._find(path)
+            value = getattr(section, key)
+            return value, section.resolvers[key.lower()].raw(value)
+        except Exception:
+            return UNRESOLVED, UNRESOLVED
+    
+    def stop_watching(self):
+        """ Stop reloading the config files in the background, see ``watch_interval``."""
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.stop()
+    
     def save(self):
         """ Save the config file.
         
-        You must call this before your application closes.
+        You must call this before your application closes, unless
+        ``use_journal`` is set. Only the lines of the settings changed 
+        since the file was read or saved are rewritten, comments in the
+        file are kept. The journal is emptied after the file is saved.
+        
+        Settings can be set while the file is written, they are saved 
+        the next time. Nothing is written if no setting changed since the
+        file was read or saved, see `is_dirty`.
         """
         if not self.userfile:
             raise SettingsException("You have not set a userconfig file on your settings object")
-        with open(self.userfile, 'r') as fd:
-            self.userconfig.write(fd)
+        if not self.userconfig.is_dirty():
+            return
+        with self._save_lock:
+            with self._lock:
+                journal = self._journal
+                size = os.fstat(journal.fileno()).st_size if journal is not None else 0
+            self.userconfig.save(self.userfile, self._lock)
+            if journal is not None:
+                self._drop_journal(size)
+
+class ResolveState(threading.local):
+    """ State of the formatted values a thread is resolving, see `BaseSettings._get_formatted`.
+    
+    Each thread has its own state, so threads reading the same value at
+    the same time are not seen as a circular reference, and the memo of a
+    bulk resolution (see `BaseSettings._reference`) is only used by the 
+    thread that set it.
+    """
+    def __init__(self):
+        self.resolving = set()
+        self.memo = None
+
+class Autosaver(object):
+    """ Saves the userconfig file of a settingsobject in a background thread.
+    
+    After the first change the thread waits ``interval`` seconds, so all
+    changes made in that time are saved at once. Errors are logged and the
+    save is tried again after the next interval.
+    
+    :param settings: The settingsobject to save
+    :param interval: Seconds between two saves
+    :type settings: `BaseSettings`
+    :type interval: ``float``
+    """
+    def __init__(self, settings, interval):
+        self.settings = settings
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.dirty = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='settingslib-autosave')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def notify(self):
+        """ Mark the userconfig as changed."""
+        with self.condition:
+            if not self.dirty:
+                self.dirty = True
+                self.condition.notify()
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                # collect the changes of the interval, stop wakes us early
+                self.condition.wait(self.interval)
+                self.dirty = False
+            self.save()
+    
+    def save(self):
+        try:
+            self.settings.save()
+        except Exception:
+            logger.exception("Autosave of the userconfig file failed")
+            self.notify()
+    
+    def stop(self):
+        """ Stop the thread and save the changes that are not saved yet."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+        if self.dirty:
+            self.dirty = False
+            self.save()
+
+class FrozenSection(object):
+    """ Immutable snapshot of a `Section`, created by `Section.freeze`.
+    
+    Values are stored as plain attributes, so ``frozen.KEY`` costs the same
+    as reading any attribute. Supports the read functions of `Section`
+    (``get``, ``has``, ``keys``, ``values``, ``items`` and ``get_dict``). Setting or
+    deleting values raises a `SettingsException`.
+    
+    Lists are copied to tuples and dicts to `FrozenDict`, so they can't be
+    changed either (see `freeze_value`).
+    
+    :param section: The section to take the snapshot of.
+    :type section: `Section`
+    """
+    def __init__(self, section):
+        values = self.__dict__
+        values['__doc__'] = section.__doc__
+        for key in section.keys():
+            value = getattr(section, key)
+            if isinstance(value, Section):
+                value = value.freeze()
+            else:
+                value = freeze_value(value)
+            values[key] = value
+    
+    def __setattr__(self, key, value):
+        raise SettingsException("A frozen settingsobject can't be changed, key : {key}".format(key=key))
+    
+    def __delattr__(self, key):
+        raise SettingsException("A frozen settingsobject can't be changed, key : {key}".format(key=key))
+    
+    def get(self, key):
+        """ Same as `Section.get`."""
+        value = self
+        for k in key.split('.'):
+            try:
+                value = value.__dict__[k.upper()]
+            except KeyError:
+                raise AttributeError("Key does not exists in Settings object, key : {key}".format(key=key))
+        return value
+    
+    def has(self, key):
+        """ Same as `Section.has`."""
+        try:
+            self.get(key)
+        except AttributeError:
+            return False
+        return True
+    
+    def keys(self):
+        """ Same as `Section.keys`."""
+        return [key for key in self.__dict__ if key.isupper()]
+    
+    def values(self):
+        """ Same as `Section.values`."""
+        return [self.__dict__[key] for key in self.keys()]
+    
+    def items(self):
+        """ Same as `Section.items`."""
+        return [(key, self.__dict__[key]) for key in self.keys()]
+    
+    def get_dict(self):
+        """ Same as `Section.get_dict`."""
+        d = {}
+        for key, value in self.items():
+            if isinstance(value, FrozenSection):
+                d[key] = value.get_dict()
+            else:
+                d[key] = value
+        return d
+    
+    def __repr__(self):
+        return "<FrozenSection @ 0x%x>" % id(self)
+
+class FrozenDict(dict):
+    """ Dict that can't be changed, changing it raises a `SettingsException`.
+    
+    Used for the dicts of a `FrozenSection` and for the extra options of a `Schema`.
+    """
+    def _frozen(self, *args, **kwargs):
+        raise SettingsException("This dict is frozen and can't be changed")
+    
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _frozen
+    del _frozen
+
+def freeze_value(value):
+    """ Returns a copy of ``value`` that can't be changed.
+    
+    Lists and tuples are copied to tuples and dicts to `FrozenDict`, the
+    values they hold are frozen too. Other values are returned as is.
+    """
+    if isinstance(value, list):
+        return tuple(freeze_value(v) for v in value)
+    if isinstance(value, tuple):
+        values = [freeze_value(v) for v in value]
+        # keep named tuples
+        return value._make(values) if hasattr(value, '_make') else tuple(values)
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze_value(v)) for k, v in value.items())
+    return value
 
 class Option(object):
     """ Class to construct advanced options
@@ -812,14 +1680,172 @@ class Resolver(object):
         self.resolverKwargs = kwargs
         
 ######################## Internal #############################
+class Schema(object):
+    """ The compiled, per class, part of a settingsobject.
+    
+    Holds everything that only depends on the class, so instances don't
+    have to build it again.
+    
+    - ``resolvers``: key --> (resolver class, resolver kwargs)
+    - ``extraOptions``: key --> extraOptions merged with the defaults, both `FrozenDict`
+    - ``initialize``: list of (key, initialize function) for non default initialize functions
+    - ``references``: key --> paths referenced by the default
+    - ``checked``: True if the defaults of the settingsobject are checked for circular references
+    - ``paths``: dotted path --> location of the setting, see `Section._get_paths`
+    """
+    __slots__ = ('generation', 'resolvers', 'extraOptions', 'initialize', 'references', 'checked', 'paths')
+    
+    def __init__(self, cls):
+        load_resolvers()
+        self.generation = len(cls._resolverTypes)
+        
+        self.resolvers = {}
+        self.references = {}
+        self.checked = False
+        self.paths = None
+        for key, resolver in cls.raw_resolvers.items():
+            default = cls.defaults[key]
+            if resolver is not None:
+                self.resolvers[key] = (cls._find_resolver(resolver.type), resolver.resolverKwargs)
+            else:
+                self.resolvers[key] = (cls._find_resolver(default.__class__, key, default), {})
+            try:
+                references = self.resolvers[key][0].references(default)
+            except Exception:
+                # not a valid default, the error is raised when the value is used
+                references = ()
+            if references:
+                self.references[key] = references
+        
+        extraOptions = {}
+        self.initialize = []
+        for key, options in cls.raw_extraOptions.items():
+            merged = dict(cls._defaultExtraOptions)
+            merged.update(options)
+            extraOptions[key] = FrozenDict(merged)
+            if 'initialize' in options:
+                self.initialize.append((key, options['initialize']))
+        # shared by all instances, so they can't be changed
+        self.extraOptions = FrozenDict(extraOptions)
+
+class ResolverIndex(object):
+    """ Index to find the resolver class for a setting.
+    
+    Works the same as asking ``supports`` of each resolver type, latest
+    added first, but uses dicts build from the ``resolve_types`` and 
+    ``resolve_suffixes`` of the resolver types. Only resolvers that override
+    ``supports`` or ``_supports`` are still asked one by one.
+    
+    :param resolverTypes: All resolver types, in the order they are added.
+    :type resolverTypes: ``list``
+    """
+    def __init__(self, resolverTypes):
+        from .resolvers import SettingsResolver
+        
+        # type --> (priority, resolver), priority is the position in resolverTypes
+        self.types = {}
+        # key ending --> (priority, resolver)
+        self.suffixes = {}
+        self.suffix_lengths = set()
+        # (priority, resolver, overrides supports) for resolver with there own supports 
+        # or _supports, highest priority first
+        self.predicates = []
+        
+        for priority, cls in enumerate(resolverTypes):
+            if getattr(cls.supports, 'im_func', None) is not SettingsResolver.supports.im_func:
+                # supports decides on its own, the tables are not used for this resolver
+                self.predicates.insert(0, (priority, cls, True))
+                continue
+            for type_ in cls.resolve_types:
+                self.types[type_] = (priority, cls)
+            for suffix in cls.resolve_suffixes:
+                self.suffixes[suffix] = (priority, cls)
+                self.suffix_lengths.add(len(suffix))
+            if getattr(cls._supports, 'im_func', None) is not SettingsResolver._supports.im_func:
+                self.predicates.insert(0, (priority, cls, False))
+    
+    def find(self, type_=None, key=None, default=None):
+        """ Find the resolver class bases on type, key_name and default value."""
+        best = self._type(type_)
+        
+        if isinstance(key, basestring):
+            lkey = key.lower()
+            for length in self.suffix_lengths:
+                found = self.suffixes.get(lkey[-length:])
+                if found is not None and (best is None or found[0] > best[0]):
+                    best = found
+        
+        best = self._ask(best, type_, key, default)
+        if best is not None:
+            return best[1]
+        
+        for subtype in getattr(type_, '__mro__', ())[1:]:
+            # the resolvers with there own _supports don't depend on the type, they are asked already
+            best = self._ask(self._type(subtype), subtype, key, default, True)
+            if best is not None:
+                return best[1]
+        return self.types['default'][1]
+    
+    def _type(self, type_):
+        """ Internal function to look up ``type_`` in the types table."""
+        try:
+            best = self.types.get(type_)
+        except TypeError:
+            return None
+        if best is None and isinstance(type_, type):
+            # types given by their full name, see ``resolve_types``
+            best = self.types.get(type_.__module__ + '.' + type_.__name__)
+        return best
+    
+    def _ask(self, best, type_, key, default, supports_only=False):
+        """ Internal function to ask the resolvers with there own ``supports`` or ``_supports``
+        that come after ``best``, latest added first.
+        """
+        for priority, cls, full in self.predicates:
+            if best is not None and priority < best[0]:
+                break
+            if supports_only and not full:
+                continue
+            try:
+                if cls.supports(type_, key, default) if full else cls._supports(key, default):
+                    return (priority, cls)
+            except Exception:
+                pass
+        return best
+
+class ResolverDict(dict):
+    """ Dict holding the resolvers of a section.
+    
+    Resolvers are created from the `Schema` the first time a key is used
+    and are bound to that key (``resolver.key``).
+    """
+    def __init__(self, settings, resolvers):
+        self.settings = settings
+        self.raw_resolvers = resolvers
+    
+    def __missing__(self, key):
+        cls, kwargs = self.raw_resolvers[key]
+        resolver = self[key] = cls(self.settings, **kwargs)
+        resolver.key = key
+        if resolver.multivalue and not resolver.has_childs():
+            resolver.set_childs(self.settings.defaults[key])
+        return resolver
+
 import ast
-import inspect
+
+class AstException(Exception):
+    pass
+
+# module name --> class name --> ClassDef nodes, see get_module_classes
+_module_classes = {}
 
 def get_assign_name(node):
     if not isinstance(node , ast.Assign):
         raise AstException("We can only pass Assign nodes")
     if len(node.targets) > 1:
         raise AstException("To many targets, we don't support this")
+    if not isinstance(node.targets[0], ast.Name):
+        raise AstException("We can only pass assigns to a name")
     return node.targets[0].id
 
 def get_attr_doc(node):
@@ -841,16 +1867,58 @@ def get_attr_doc(node):
             lastname = None
     return doc
 
-def get_attr_doc_form_class(clsname, module):
-    m = ast.parse(inspect.getsource(module))
+def get_class_names(node):
+    """ Returns the names of the attrs assigned and classes defined in the body of a ClassDef node."""
+    names = set()
+    for clsnode in ast.iter_child_nodes(node):
+        if isinstance(clsnode, ast.ClassDef):
+            names.add(clsnode.name)
+        else:
+            try:
+                names.add(get_assign_name(clsnode))
+            except AstException:
+                pass
+    return names
+
+def get_module_classes(module):
+    """ Returns a dict class name --> list of ClassDef nodes of all classes in ``module``.
+    
+    The source of a module is parsed once, all classes of the module
+    share the result. If the source can't be found an empty dict is returned.
+    """
+    try:
+        return _module_classes[module.__name__]
+    except KeyError:
+        pass
+    import inspect
     
-    # try to find the class by name 'clsname'
+    classes = {}
+    try:
+        tree = ast.parse(inspect.getsource(module))
+    except (IOError, TypeError, SyntaxError):
+        tree = None
+    if tree is not None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                classes.setdefault(node.name, []).append(node)
+    _module_classes[module.__name__] = classes
+    return classes
+
+def get_attr_doc_form_class(clsname, module, keys=()):
+    """ Returns the attr docs of the uppercase attrs of class ``clsname`` in ``module``.
+    
+    If the module has more classes named ``clsname``, the class
+    whose uppercase attrs match ``keys`` best is used.
+    """
+    keys = set(keys)
     clsnode = None
-    for node in ast.walk(m):
-        if isinstance(node, ast.ClassDef) and node.name == clsname:
-            clsnode = node
-            break
+    best = None
+    for node in get_module_classes(module).get(clsname, ()):
+        names = set(name for name in get_class_names(node) if name.isupper())
+        score = len(names.symmetric_difference(keys))
+        if best is None or score < best:
+            clsnode, best = node, score
     if clsnode is not None:
         doc = dict((k,v) for k,v in get_attr_doc(clsnode).items() if k.isupper())
         return doc
-    return {}
\ No newline at end of file
+    return {}
@@ -22,21 +22,48 @@ Significant points:
 Edited to allow the passing and writing of comments (Loek17)
 """
 
+import bisect
 import cStringIO as StringIO
+import marshal
+import mmap
+import os
 import re
+import stat
+import time
 
 class ConfigFile(object):
+    """
+    Values are kept in a dict, the order of the keys in a list. Comments
+    are only stored for configs that have them.
+
+    A section knows its parent and its key in the parent. Changes are
+    recorded as key paths in the Source of the root, if the root was
+    read with read_file (see save).
+
+    Each change increments the version of the root and sets the version
+    of the sections holding the key to it. A section is dirty if its 
+    version is newer than the version of the root when it was last read
+    or saved (see is_dirty).
+    """
+    __slots__ = ('_ConfigFile__values', '_ConfigFile__order',
+                 '_ConfigFile__comments', '_ConfigFile__section_comment',
+                 '_ConfigFile__parent', '_ConfigFile__key', '_ConfigFile__source',
+                 '_ConfigFile__version', '_ConfigFile__saved')
+
     def __init__(self):
-        self.__dict__['_ConfigFile__values'] = []
-        self.__dict__['_ConfigFile__sections'] = []
-        self.__dict__['_ConfigFile__comments'] = {}
-        self.__dict__['_ConfigFile__section_comment'] = []
+        object.__setattr__(self, '_ConfigFile__values', {})
+        object.__setattr__(self, '_ConfigFile__order', [])
+        object.__setattr__(self, '_ConfigFile__comments', None)
+        object.__setattr__(self, '_ConfigFile__section_comment', None)
+        object.__setattr__(self, '_ConfigFile__parent', None)
+        object.__setattr__(self, '_ConfigFile__key', None)
+        object.__setattr__(self, '_ConfigFile__source', None)
+        object.__setattr__(self, '_ConfigFile__version', 0)
+        object.__setattr__(self, '_ConfigFile__saved', 0)
 
     def __cmp__(self, other):
-        v1 = self.__values[:]
-        v1.sort()
-        v2 = self.__values[:]
-        v2.sort()
+        v1 = sorted(self.__order)
+        v2 = sorted(other.keys())
         result = cmp(v1, v2)
         if result:
             return result
@@ -51,37 +78,114 @@ class ConfigFile(object):
             return self.__cmp__(other) == 0
         return False
 
+    def __ne__(self, other):
+        return not self == other
+
     def __getitem__(self, key):
-        if key in self.__values:
-            return self.__dict__[key]
-        self.__dict__[key] = ConfigFile()
-        self.__values.append(key)
-        return self.__dict__[key]
-    __getattr__ = __getitem__
+        try:
+            return self.__values[key]
+        except KeyError:
+            # an empty section is not a change, the keys set in it are
+            cfg = ConfigFile()
+            self._load(key, cfg)
+            return cfg
+
+    def __getattr__(self, key):
+        # special attrs are never config keys, so hasattr, copy and pickle work
+        if key[:2] == '__' and key[-2:] == '__':
+            raise AttributeError(key)
+        return self[key]
 
     def __setitem__(self, key, val):
-        self.__dict__[key] = val
-        if key not in self.__values:
-            self.__values.append(key)
+        self._load(key, val)
+        self.__changed(key)
     __setattr__ = __setitem__
     
+    def __delitem__(self, key):
+        self._unload(key)
+        self.__changed(key)
+    __delattr__ = __delitem__
+
+    def _load(self, key, val):
+        """
+        Set a value without recording a change, used to fill the config
+        from a file.
+        """
+        values = self.__values
+        if key in values:
+            old = values[key]
+            if isinstance(old, ConfigFile) and old is not val:
+                old.__adopt(None, None)
+        else:
+            self.__order.append(key)
+        values[key] = val
+        if isinstance(val, ConfigFile):
+            val.__adopt(self, key)
+
+    def _unload(self, key):
+        """
+        Delete a key without recording a change.
+        """
+        old = self.__values.pop(key)
+        self.__order.remove(key)
+        if self.__comments:
+            self.__comments.pop(key, None)
+        if isinstance(old, ConfigFile):
+            old.__adopt(None, None)
+
+    def __adopt(self, parent, key):
+        object.__setattr__(self, '_ConfigFile__parent', parent)
+        object.__setattr__(self, '_ConfigFile__key', key)
+
+    def __changed(self, key):
+        path = [key]
+        sections = [self]
+        cfg = self
+        while cfg.__parent is not None:
+            path.append(cfg.__key)
+            cfg = cfg.__parent
+            sections.append(cfg)
+        version = cfg.__version + 1
+        for section in sections:
+            object.__setattr__(section, '_ConfigFile__version', version)
+        if cfg.__source is not None:
+            path.reverse()
+            cfg.__source.changed.add(tuple(path))
+    
+    def is_dirty(self):
+        """
+        Return True if a key of the config, or of its sections, changed 
+        since the root was read or saved.
+        """
+        root = self
+        while root.__parent is not None:
+            root = root.__parent
+        return self.__version > root.__saved
+
+    def __clean(self, version=None):
+        object.__setattr__(self, '_ConfigFile__saved', self.__version if version is None else version)
+
+    def __contains__(self, key):
+        return key in self.__values
+    
     def keys(self):
-        return self.__values
+        return self.__order[:]
     
     def values(self):
-        return [self[key] for key in self.__values]
+        return [self.__values[key] for key in self.__order]
     
     def items(self):
-        return [(key, self[key]) for key in self.__values]
+        return [(key, self.__values[key]) for key in self.__order]
     
     def sections(self):
-        return [section for section in self.__values if isinstance(self[section], ConfigFile)]
+        return [key for key in self.__order if isinstance(self.__values[key], ConfigFile)]
     
     def help(self, key=None):
         if key is None:
-            return "\n".join(self.__section_comment)
+            return "\n".join(self.__section_comment or ())
         elif key in self.__values:
-            return "\n".join(self.__comments[key]) if key in self.__comments else ""
+            comments = self.__comments or {}
+            return "\n".join(comments[key]) if key in comments else ""
         else:   
             return self[key].help()
     
@@ -91,145 +195,910 @@ class ConfigFile(object):
         if isinstance(message, basestring):
             message = message.split('\n')
         if key is None: 
+            if self.__section_comment is None:
+                object.__setattr__(self, '_ConfigFile__section_comment', [])
             self.__section_comment.extend(message)
         elif key in self.__values:
+            if self.__comments is None:
+                object.__setattr__(self, '_ConfigFile__comments', {})
             self.__comments[key] = message
         else:
             self[key].set_help(None, message)
     
-    def write(self, fp):
+    def write(self, fp, prefix="", spans=None, path=()):
+        """
+        Write the config to fp, any object with a write method. The sections
+        are written directly to fp, each line starts with prefix and 4 
+        spaces for each level of nesting.
+
+        If spans is a dict the offsets of the keys are recorded in it (see 
+        Source) with fp.tell(), path is the path of the config.
+        """
         if self.__section_comment:
             lengte = 5 # min lengte
             for line in self.__section_comment:
                 if lengte < len(line.strip()):
                     lengte = len(line)
             lengte += 4
-            fp.write("{}\n".format("#"*lengte))
+            write_line(fp, prefix, "#"*lengte)
             for line in self.__section_comment:
-                fp.write("# {} #\n".format(line.ljust(lengte-4)))
-            fp.write("{}\n".format("#"*lengte))
+                write_line(fp, prefix, "# {} #".format(line.ljust(lengte-4)))
+            write_line(fp, prefix, "#"*lengte)
             
-        for attr in self.__values:
-            item = self[attr]
-            if isinstance(item, ConfigFile):
-                subfp = StringIO.StringIO()
-                item.write(subfp)
-                fp.write('\n')
-                fp.write("%s:\n" % attr)
-                subfp.seek(0)
-                section_open = False
-                for line in subfp:
-                    fp.write(" "*4)
-                    fp.write(line)
+        for attr in self.__order:
+            self.write_item(fp, prefix, attr, True, spans, path)
+
+    def write_item(self, fp, prefix, attr, comments=True, spans=None, path=()):
+        """
+        Write one key of the config to fp, with its comments if comments
+        is True. A section starts with an empty line if comments is True.
+        spans and path are used as in write.
+        """
+        item = self.__values[attr]
+        if isinstance(item, ConfigFile):
+            if comments:
+                write_line(fp, prefix, "")
+            if spans is not None:
+                start = fp.tell()
+            write_line(fp, prefix, "%s:" % attr)
+            if spans is None:
+                item.write(fp, prefix + " "*4)
             else:
-                if attr in self.__comments:
-                    for line in self.__comments[attr]:
-                        fp.write("# %s\n" % line)
-                fp.write("%s = %s\n" % (attr, item))
-
-    def read(self, fp):
-        for v in self.__values:
-            delattr(self, v)
-            
-        self.read_helper(PushBackFile(fp), "")
-
-    def read_helper(self, fp, indent):
-        #print ">", id(self)
-        key = None
-        
-        for line in fp:
-            mat = re.match(r'([ \t]*)(.*)$', line)
-            left, right = mat.groups()
-            
-            if not right:
-                # empty line, we skip it
-                continue
-            elif len(left) < len(indent):
-                # indent is smaller the the passed indent, section ended, returning
-                # push the line back to the "file"
-                fp.push(line)
-                #print "<", id(self), "extinging indent", len(left), "line", line
-                return
-            
-            elif len(left) > len(indent):
-                # multi line values, append them to the last key
-                if not key:
-                    raise ValueError, "Extra indent, but no lastkey, line %d" % fp.lineno
-                self[key.strip()] += " %s" % right
-            elif right[-1:] == ':':
-                # new section
-                section = right[:-1].strip()
-                if not section:
-                    raise ValueError, "Empty section, line %d" % fp.lineno
-                cfg = self[section] = ConfigFile()
-                # get the next line (with text) add push is back directly
-                while True:
-                    newline = fp.next(stack=False)
-                    fp.push(newline)
-                    if newline.strip() and not newline.strip().startswith("#"):
-                        break
-                if newline:
-                    mat = re.match(r'([ \t]*)', newline)
-                    # if indent is bigger read the new subsection
-                    if len(mat.group(0)) > len(indent):
-                        cfg.read_helper(fp, mat.group(0))
+                end = fp.tell()
+                item.write(fp, prefix + " "*4, spans, path + (attr,))
+                spans[path + (attr,)] = [start, end, fp.tell(), len(prefix) + 4]
+        else:
+            if comments and self.__comments and attr in self.__comments:
+                for line in self.__comments[attr]:
+                    write_line(fp, prefix, "# %s" % line)
+            if spans is not None:
+                start = fp.tell()
+            write_line(fp, prefix, "%s = %s" % (attr, item))
+            if spans is not None:
+                spans[path + (attr,)] = [start, fp.tell()]
+
+    def read(self, fp, parser=None):
+        """
+        Read the config from fp. Regular files are read through mmap (see
+        map_file), other file like objects are iterated line by line.
+        """
+        if parser is None:
+            parser = self.parser()
+        mapped = map_file(fp)
+        if mapped is not None:
+            try:
+                parser.parse_buffer(mapped)
+            finally:
+                mapped.close()
+                fp.seek(0, os.SEEK_END)
+        else:
+            for line in fp:
+                parser.parse_line(line)
+        parser.close()
+        self.__clean()
+
+    def read_file(self, path):
+        """
+        Read the config from the file at path and remember where each key
+        is in the file, so save can rewrite only the keys that changed.
+        """
+        spans = {}
+        with open(path, 'r') as fp:
+            parser = self.parser(spans=spans)
+            self.read(fp, parser)
+            st = os.fstat(fp.fileno())
+        source = Source(path, st, spans if parser.patchable else None)
+        object.__setattr__(self, '_ConfigFile__source', source)
+
+    def save(self, path, lock=None):
+        """
+        Write the config to the file at path. The file is written to a temp
+        file that replaces path, so readers never see a partly written file.
+
+        If the config was read from path with read_file (or saved to it
+        before) and the file did not change since, only the lines of the 
+        keys that changed are rewritten. Comments and layout of the rest
+        of the file are kept. Otherwise the whole config is written.
+
+        If lock is given it is held while the config is read, but not while
+        the file is read or written. Changes made with the lock held while
+        the file is written are saved the next time. Nothing is written if
+        the config was read from path or saved to it and did not change
+        since (see is_dirty).
+        """
+        source = self.__source
+        if source is not None and source.path == path and not self.is_dirty():
+            return
+        if source is not None and (source.path != path or not source.matches()):
+            source = None
+        data = source.read() if source is not None else None
+        try:
+            if lock is None:
+                plan = self.__plan(path, source, data)
             else:
-                # a key value combination
-                #print "adding key, value : ", right
-                if '=' in right:
-                    key, val = right.split('=', 1)
+                with lock:
+                    plan = self.__plan(path, source, data)
+            if plan is None:
+                return
+            source, edits, changed, version = plan
+            try:
+                with atomic_file(path) as out:
+                    if isinstance(edits, str):
+                        out.write(edits)
+                    else:
+                        source.apply(edits, data, out)
+            except:
+                source.changed.update(changed)
+                raise
+            source.saved()
+            self.__clean(version)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def __plan(self, path, source, data):
+        """
+        Return (source, edits, changed, version) for save, or None if 
+        nothing changed. If the file can't be patched edits is the text of
+        the whole file. changed are the changes that are saved, version is
+        the version of the config that is saved.
+        """
+        version = self.__version
+        if source is not None:
+            if not source.changed:
+                return None
+            edits = source.prepare(self, data)
+            if edits is not None:
+                changed, source.changed = source.changed, set()
+                return source, edits, changed, version
+        text = StringIO.StringIO()
+        spans = {}
+        self.write(text, spans=spans)
+        text = text.getvalue()
+        spans[()] = [0, len(text), len(text), 0]
+        source = Source(path, None, spans)
+        object.__setattr__(self, '_ConfigFile__source', source)
+        return source, text, set(), version
+
+    def diff(self, other):
+        """
+        Return the paths of the keys with a different value in other, a
+        key that is in only one of them is different too. Sections in both
+        are compared key by key.
+        """
+        paths = []
+        stack = [((), self, other)]
+        while stack:
+            path, old, new = stack.pop()
+            for key in old.__order:
+                if key not in new.__values:
+                    paths.append(path + (key,))
+            for key in new.__order:
+                value = new.__values[key]
+                if key not in old.__values:
+                    paths.append(path + (key,))
+                elif isinstance(value, ConfigFile) and isinstance(old.__values[key], ConfigFile):
+                    stack.append((path + (key,), old.__values[key], value))
+                elif value != old.__values[key]:
+                    paths.append(path + (key,))
+        return paths
+
+    def update(self, other, paths):
+        """
+        Set the keys at paths (see diff) to their value in other, or delete
+        them if they are not in other. No changes are recorded. The sections
+        of other are moved to this config.
+        """
+        for path in paths:
+            old = self.get_path(path[:-1])
+            new = other.get_path(path[:-1])
+            key = path[-1]
+            if key in new.__values:
+                old._load(key, new.__values[key])
+            elif key in old.__values:
+                old._unload(key)
+
+    def get_path(self, path):
+        """
+        Return the value at path, a tuple of keys, or raise a KeyError.
+        Sections are not created.
+        """
+        cfg = self
+        for key in path:
+            if not isinstance(cfg, ConfigFile):
+                raise KeyError(key)
+            cfg = cfg.__values[key]
+        return cfg
+
+    def read_path(self, path, cache=None):
+        """
+        Read the config from the file at path. If cache is set the parsed
+        config is cached, see read_cached.
+        """
+        if cache is None:
+            with open(path, 'r') as fp:
+                self.read(fp)
+        else:
+            self.from_tree(read_cached(path, cache))
+
+    def to_tree(self):
+        """
+        Return the keys and values as nested lists of (key, value) tuples,
+        the value of a section is a list too. Comments are not included.
+        """
+        return [(key, value.to_tree() if isinstance(value, ConfigFile) else value)
+                for key, value in self.items()]
+
+    def from_tree(self, tree):
+        """
+        Clear the config and fill it from a tree created by to_tree.
+        """
+        self.clear()
+        stack = [(self, tree)]
+        while stack:
+            cfg, items = stack.pop()
+            for key, value in items:
+                if isinstance(value, list):
+                    section = ConfigFile()
+                    cfg._load(key, section)
+                    stack.append((section, value))
                 else:
-                    # empty value
-                    key, val = right, ""
-                self[key.strip()] = val.strip()
+                    cfg._load(key, value)
+        self.__clean()
+
+    def parser(self, max_line=None, spans=None):
+        """
+        Clear the config and return a Parser to read it in chunks, the
+        result is the same as reading the same data with read.
+        """
+        self.clear()
+        return Parser(self, max_line, spans)
+
+    def clear(self):
+        for value in self.__values.itervalues():
+            if isinstance(value, ConfigFile):
+                value.__adopt(None, None)
+        self.__values.clear()
+        del self.__order[:]
+        if self.__comments:
+            self.__comments.clear()
+        object.__setattr__(self, '_ConfigFile__source', None)
 
     def __str__(self):
         return "<ConfigFile @ 0x%x>" % id(self)
     __repr__ = __str__
 
-class PushBackFile(object):
-    def __init__(self, fp):
-        self.fp = fp
-        self.stack = []
+class LazyConfigFile(ConfigFile):
+    """
+    A ConfigFile that records the path of the file and only reads it the
+    first time the config is used. Errors opening or parsing the file are
+    raised at that moment. cache is passed to read_path.
+    """
+    __slots__ = ('_LazyConfigFile__path', '_LazyConfigFile__loaded', '_LazyConfigFile__cache',
+                 '_LazyConfigFile__stat')
+
+    def __init__(self, path, cache=None):
+        ConfigFile.__init__(self)
+        object.__setattr__(self, '_LazyConfigFile__path', path)
+        object.__setattr__(self, '_LazyConfigFile__loaded', False)
+        object.__setattr__(self, '_LazyConfigFile__cache', cache)
+        object.__setattr__(self, '_LazyConfigFile__stat', None)
+
+    def load(self):
+        """
+        Read the file if it is not read yet. If reading fails the config
+        stays empty and not loaded, so the next access fails the same way.
+        """
+        if not self.__loaded:
+            key = file_key(self.__path)
+            # set while reading, the config is filled through this object
+            object.__setattr__(self, '_LazyConfigFile__loaded', True)
+            try:
+                self.read_path(self.__path, self.__cache)
+            except:
+                ConfigFile.clear(self)
+                object.__setattr__(self, '_LazyConfigFile__loaded', False)
+                raise
+            object.__setattr__(self, '_LazyConfigFile__stat', key)
+
+    def reload(self):
+        """
+        Return the config read again if the file changed since it was read,
+        else None. A removed file reads as an empty config. The config
+        itself is not changed, see diff and update.
+        """
+        if not self.__loaded:
+            return None
+        key = file_key(self.__path)
+        if key == self.__stat:
+            return None
+        config = ConfigFile()
+        if key is not None:
+            config.read_path(self.__path, self.__cache)
+        object.__setattr__(self, '_LazyConfigFile__stat', key)
+        return config
+
+    def loaded(self):
+        return self.__loaded
+
+    def path(self):
+        return self.__path
+
+    def _loading(func):
+        def wrapper(self, *args, **kwargs):
+            self.load()
+            return func(self, *args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    __cmp__ = _loading(ConfigFile.__cmp__.im_func)
+    __getitem__ = _loading(ConfigFile.__getitem__.im_func)
+    __getattr__ = _loading(ConfigFile.__getattr__.im_func)
+    __setitem__ = __setattr__ = _loading(ConfigFile.__setitem__.im_func)
+    __delitem__ = __delattr__ = _loading(ConfigFile.__delitem__.im_func)
+    __contains__ = _loading(ConfigFile.__contains__.im_func)
+    keys = _loading(ConfigFile.keys.im_func)
+    clear = _loading(ConfigFile.clear.im_func)
+    values = _loading(ConfigFile.values.im_func)
+    items = _loading(ConfigFile.items.im_func)
+    sections = _loading(ConfigFile.sections.im_func)
+    help = _loading(ConfigFile.help.im_func)
+    set_help = _loading(ConfigFile.set_help.im_func)
+    write = _loading(ConfigFile.write.im_func)
+    del _loading
+
+    def __str__(self):
+        return "<LazyConfigFile %s @ 0x%x>" % (self.__path, id(self))
+    __repr__ = __str__
+
+# change this each time the parser creates a different tree for the same file
+PARSER_VERSION = 1
+
+def cache_path(path, cache=True):
+    """
+    Return the location of the cache file of the config file at path. If
+    cache is True the cache is next to the config file, else cache is the
+    directory holding the cache files.
+    """
+    path = os.path.abspath(path)
+    if cache is True:
+        return path + '.cache'
+    import hashlib
+    return os.path.join(cache, hashlib.sha1(path).hexdigest() + '.cache')
+
+def read_cached(path, cache=True):
+    """
+    Return the tree (see ConfigFile.to_tree) of the config file at path.
+
+    The tree is loaded from the cache file if the path, size, mtime and
+    inode of the file and the parser version did not change since it was
+    cached. Otherwise the file is parsed and the cache file is written.
+    A cache file that can't be read or written is ignored, the file is 
+    just parsed.
+    """
+    st = os.stat(path)
+    key = (PARSER_VERSION, os.path.abspath(path), st.st_size, st.st_mtime, st.st_ino)
+    cached = cache_path(path, cache)
+    try:
+        with open(cached, 'rb') as fp:
+            cached_key, tree = marshal.load(fp)
+        if cached_key == key:
+            return tree
+    except (EnvironmentError, EOFError, ValueError, TypeError):
+        # no cache yet or corrupted
+        pass
+
+    cfg = ConfigFile()
+    with open(path, 'r') as fp:
+        cfg.read(fp)
+    tree = cfg.to_tree()
+    # a file changed within the mtime resolution could change again 
+    # without changing the key, only cache files that are a bit older
+    if time.time() - st.st_mtime > 2:
+        write_cache(cached, key, tree)
+    return tree
+
+def write_cache(cached, key, tree):
+    """
+    Write a cache file, the file is written to a temp file first and
+    renamed so readers never see a partly written cache.
+    """
+    import tempfile
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cached), prefix='.', suffix='.tmp')
+    except EnvironmentError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            marshal.dump((key, tree), fp)
+        os.rename(tmp, cached)
+    except EnvironmentError:
+        try:
+            os.remove(tmp)
+        except EnvironmentError:
+            pass
+
+def file_key(path):
+    """
+    Return (size, mtime, inode) of the file at path, a new key means the
+    file changed. Returns None if the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except EnvironmentError:
+        return None
+    return (st.st_size, st.st_mtime, st.st_ino)
+
+def write_line(fp, prefix, text):
+    """
+    Write text as a line to fp, each line of text starts with prefix.
+    """
+    if "\n" in text:
+        text = text.replace("\n", "\n" + prefix)
+    fp.write("%s%s\n" % (prefix, text))
+
+class atomic_file(object):
+    """
+    Context manager returning a temp file next to path, the temp file
+    replaces path if the block succeeds, else it is removed.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        import tempfile
+        dirname, name = os.path.split(os.path.abspath(self.path))
+        fd, self.tmp = tempfile.mkstemp(dir=dirname, prefix='.%s.' % name, suffix='.tmp')
+        self.fp = os.fdopen(fd, 'w+')
+        return self.fp
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.fp.flush()
+                os.fsync(self.fp.fileno())
+            self.fp.close()
+            if exc_type is None:
+                if os.path.exists(self.path):
+                    os.chmod(self.tmp, stat.S_IMODE(os.stat(self.path).st_mode))
+                os.rename(self.tmp, self.path)
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+class Source(object):
+    """
+    The file a ConfigFile was read from or saved to, and where its keys
+    are in that file.
+
+    spans maps key paths (tuples of keys) to [start, end] offsets of the 
+    lines of a value, or to [start, end, content end, indent] for a 
+    section: the header line, the end of its last line and the indent of
+    its keys. The root is the empty path. A value that can't be rewritten
+    on its own maps to False. If spans is None the file is indexed again
+    the first time it is patched.
+
+    The spans are not moved when the file is patched, instead the edits
+    of each patch are added to log and a span is moved when it is used
+    (see get). epochs holds the number of edits in log when a span was
+    recorded, if it was not recorded with the file. changed holds the 
+    paths of the keys changed since the file was read or saved.
+    """
+    __slots__ = ('path', 'stat', 'spans', 'log', 'epochs', 'changed')
+
+    # number of patches after which all spans are moved
+    MAX_LOG = 32
+
+    def __init__(self, path, st, spans=None):
+        self.path = path
+        self.stat = None if st is None else (st.st_size, st.st_mtime, st.st_ino)
+        self.spans = spans
+        self.log = []
+        self.epochs = {}
+        self.changed = set()
+
+    def matches(self):
+        """
+        Return True if the file did not change since it was read or saved.
+        """
+        return self.stat is not None and file_key(self.path) == self.stat
+
+    def saved(self):
+        """
+        Mark the file as saved.
+        """
+        st = os.stat(self.path)
+        self.stat = (st.st_size, st.st_mtime, st.st_ino)
+
+    def read(self):
+        """
+        Return the contents of the file, a mmap for regular files.
+        """
+        with open(self.path, 'rb') as fp:
+            data = map_file(fp)
+            return fp.read() if data is None else data
+
+    def get(self, path):
+        """
+        Return the span of path in the file, None if path is not in the
+        file.
+        """
+        span = self.spans.get(path)
+        if span and path:
+            for edits in self.log[self.epochs.get(path, 0):]:
+                span = move(span, path, *edits)
+                if span is None:
+                    break
+        return span
+
+    def prepare(self, cfg, data):
+        """
+        Return the edits to patch data, the contents of the file, with the
+        changed keys of cfg, or None if the file can't be patched. See 
+        edits.
+        """
+        if self.spans is None:
+            self.spans = index(data)
+            self.log = []
+            self.epochs = {}
+        return self.edits(cfg, data) if self.spans else None
+
+    def apply(self, edits, data, out):
+        """
+        Write data, the contents of the file, with edits applied to out and
+        move the spans to the new file.
+        """
+        # the spans are updated while writing, if writing fails the file
+        # is indexed again
+        spans = self.spans
+        self.spans = None
+        epoch = len(self.log) + 1
+        pos = 0
+        written = 0
+        for start, end, depth, order, text, parent, local in edits:
+            out.write(data[pos:start])
+            written += start - pos
+            for path, span in local.iteritems():
+                spans[path] = [offset + written for offset in span[:3]] + span[3:]
+                self.epochs[path] = epoch
+            out.write(text)
+            written += len(text)
+            pos = end
+        out.write(data[pos:])
+        written += len(data) - pos
+        spans[()] = [0, written, written, 0]
+        self.spans = spans
+
+        total = [0]
+        for start, end, depth, order, text, parent, local in edits:
+            total.append(total[-1] + len(text) - (end - start))
+        self.log.append(([edit[0] for edit in edits], [edit[1] for edit in edits],
+                         total, [edit[5] for edit in edits]))
+        if len(self.log) > self.MAX_LOG:
+            for path in spans.keys():
+                span = self.get(path)
+                if span is None:
+                    del spans[path]
+                else:
+                    spans[path] = span
+            self.log = []
+            self.epochs = {}
+
+    def edits(self, cfg, data):
+        """
+        Return a sorted list of edits (start, end, depth, order, text,
+        parent, spans) replacing the lines between start and end with
+        text, or None if the changes can't be written as edits. Keys added
+        at the same offset are written deepest section first, then in the
+        order of the config. The spans of the keys in text are relative
+        to the start of text.
+        """
+        paths = set()
+        for path in self.changed:
+            # the first key on the path that is not a section in the file,
+            # the key is written again with everything below it
+            for i in range(1, len(path)):
+                span = self.get(path[:i])
+                if not span or len(span) == 2:
+                    path = path[:i]
+                    break
+            paths.add(path)
+
+        edits = []
+        for path in paths:
+            if any(path[:i] in paths for i in range(1, len(path))):
+                continue
+            try:
+                parent = cfg.get_path(path[:-1])
+            except KeyError:
+                continue
+            if not isinstance(parent, ConfigFile):
+                continue
+            section = self.get(path[:-1])
+            span = self.get(path)
+            if span is False:
+                return None
+            key = path[-1]
+            text = StringIO.StringIO()
+            local = {}
+            if span is None:
+                pos = section[2]
+                if pos and data[pos-1] != '\n':
+                    text.write('\n')
+            if key in parent:
+                parent.write_item(text, " " * section[3], key, span is None, local, path[:-1])
+            text = text.getvalue()
+            if span is not None:
+                end = span[2] if len(span) == 4 else span[1]
+                edits.append((span[0], end, 0, 0, text, None, local))
+            elif key in parent:
+                edits.append((pos, pos, -len(path), parent.keys().index(key), text, path[:-1], local))
+        edits.sort()
+
+        pos = 0
+        for edit in edits:
+            if edit[0] < pos:
+                return None
+            pos = edit[1]
+        return edits
+
+def move(span, path, starts, ends, total, parents):
+    """
+    Return span, the span of path, moved by the edits of one patch or None
+    if the lines of span were replaced or removed.
+    """
+    start = span[0]
+    i = bisect.bisect_right(ends, start)
+    if i < len(ends) and starts[i] <= start:
+        return None
+    moved = [start + total[i], span[1] + total[bisect.bisect_left(ends, span[1])]]
+    if len(span) == 4:
+        # keys added at the end of the section or a section in it are part
+        # of the section, keys added to its parents not
+        end = span[2]
+        i = bisect.bisect_left(ends, end)
+        delta = total[i]
+        while i < len(ends) and ends[i] == end:
+            if parents[i] is None or parents[i][:len(path)] == path:
+                delta += total[i+1] - total[i]
+            i += 1
+        moved += [end + delta, span[3]]
+    return moved
+
+def index(data):
+    """
+    Return the spans (see Source) of the config in data, or None if the
+    config can't be patched.
+    """
+    spans = {}
+    parser = ConfigFile().parser(spans=spans)
+    try:
+        parser.parse_buffer(data)
+        parser.close()
+    except ValueError:
+        return None
+    return spans if parser.patchable else None
+
+def map_file(fp):
+    """
+    Return a read only mmap of fp, or None if fp is not a regular file
+    at its start (pipes, sockets, StringIO, empty files).
+    """
+    try:
+        fileno = fp.fileno()
+        if not stat.S_ISREG(os.fstat(fileno).st_mode) or fp.tell() != 0:
+            return None
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError, mmap.error):
+        # no fileno, empty files can't be mapped
+        return None
+
+_indent_re = re.compile(r'[ \t]*')
+# empty lines and comments before a line, the indent and the rest of the line
+_line_re = re.compile(r'((?:[ \t\r\f\v]*(?:#[^\n]*)?(?:\n|\Z))*)([ \t]*)([^\n]*)\n?')
+
+def count_lines(data, start, end):
+    """
+    Count the newlines in data[start:end] without copying it, data can
+    be a string or a buffer like a mmap.
+    """
+    count = 0
+    pos = data.find('\n', start, end)
+    while pos != -1:
+        count += 1
+        pos = data.find('\n', pos + 1, end)
+    return count
+
+def split_indent(line):
+    """
+    Split a line in the width of its indent and the rest of the line.
+    Tabs in the indent are expanded to the next multiple of 4.
+    """
+    left = _indent_re.match(line).group(0)
+    if '\t' not in left:
+        return len(left), line[len(left):]
+    width = 0
+    for c in left:
+        if c == '\t':
+            width += 4 - width % 4
+        else:
+            width += 1
+    return width, line[len(left):]
+
+class Parser(object):
+    """
+    Reads the lines of a config file into a ConfigFile in a single pass.
+
+    The open sections are kept on a stack of [indent, config, last key,
+    path], each line is handled once. Lines starting with a '#' and empty
+    lines are skipped. A line indented deeper than its section continues
+    the value of the last key of that section. A section with a deeper
+    indented next line reads the following lines until the indent is 
+    smaller again.
+
+    Lines can be passed one by one to parse_line, or the data can be
+    passed in chunks of any size to feed. Call close after the last
+    line or chunk. A line that is not complete yet is kept until the
+    rest arrives, if it gets longer than max_line a ValueError is raised.
+
+    If spans is a dict, the offsets of the keys are recorded in it, see
+    Source. patchable is set to False if the file has keys that can't be
+    rewritten on their own.
+    """
+    MAX_LINE = 1024 * 1024
+
+    def __init__(self, cfg, max_line=None, spans=None):
+        self.cfg = cfg
+        self.stack = [[0, cfg, None, ()]]
+        # section waiting for its first line
+        self.pending = None
         self.lineno = 0
+        self.max_line = self.MAX_LINE if max_line is None else max_line
+        # the start of a line that is not complete yet
+        self.buffer = []
+        self.buffered = 0
+        # offsets of the current line and the end of the last parsed line
+        self.start = 0
+        self.offset = 0
+        self.last_end = 0
+        self.spans = spans
+        self.patchable = True
+        # path of the key or section of the last parsed line
+        self.last_path = None
+        if spans is not None:
+            spans[()] = [0, 0, 0, 0]
 
-    def __iter__(self):
-        return self
+    def feed(self, data):
+        lines = data.split('\n')
+        last = lines.pop()
+        if lines and self.buffer:
+            self.buffer.append(lines[0])
+            lines[0] = "".join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+        for line in lines:
+            self.parse_line(line, len(line) + 1)
+        if last:
+            self.buffered += len(last)
+            if self.buffered > self.max_line:
+                raise ValueError, "Line longer than %d characters, line %d" % (self.max_line, self.lineno + 1)
+            self.buffer.append(last)
 
-    def next(self, stack=True):
-        while True:
-            if self.stack and stack:
-                line = self.stack.pop()
-            else:
-                line = self.fp.next()
-            if line.strip()[:1] != "#":
-                break
+    def parse_line(self, line, length=None):
+        """
+        Parse one line, length is the length of the line in the file if
+        the newline is not included in line.
+        """
         self.lineno += 1
-        line = self.untab(line.rstrip())
-        #print "+", line
-        return line
-
-    def push(self, line):
-        if line:
-            self.lineno -= 1
-        #print "-", line.rstrip()
-        self.stack.insert(0,line)
-
-    def untab(self, line):
-        "expand tabs in leading whitespace to spaces"
-        newline = []
-        line = list(line)
-        while line:
-            c = line[0]
-            del line[0]
-            if c == " ":
-                newline.append(" ")
-            elif c == "\t":
-                newline.append(" ")
-                while len(newline) % 4:
-                    newline.append(" ")
-            else:
-                newline.append(c)
-                newline.extend(line)
-                line = []
-        return "".join(newline)
\ No newline at end of file
+        self.start = self.offset
+        self.offset += len(line) if length is None else length
+        line = line.rstrip()
+        if line.lstrip()[:1] in ('', '#'):
+            # empty line or comment
+            return
+        indent, right = split_indent(line)
+        self.parse(indent, right)
+
+    def parse_buffer(self, data):
+        """
+        Parse all lines in data, a string or a buffer like a mmap. Skipped
+        lines are not copied out of data.
+        """
+        match = _line_re.match
+        pos = 0
+        size = len(data)
+        while pos < size:
+            m = match(data, pos)
+            start = self.start = m.start(2)
+            if start > pos:
+                self.lineno += count_lines(data, pos, start)
+            left, right = m.group(2, 3)
+            pos = start + len(left) + len(right) + 1
+            self.offset = min(pos, size)
+            self.lineno += 1
+            right = right.rstrip()
+            if right:
+                if '\t' in left:
+                    indent = split_indent(left)[0]
+                else:
+                    indent = len(left)
+                self.parse(indent, right)
+        self.offset = size
+
+    def parse(self, indent, right):
+        """
+        Parse a line that is not empty or a comment, indent is the width
+        of the indent and right the rest of the line without trailing
+        whitespace. The line starts at self.start and ends at self.offset.
+        """
+        stack = self.stack
+        spans = self.spans
+        if self.pending is not None:
+            cfg, path = self.pending
+            self.pending = None
+            if indent > stack[-1][0]:
+                stack.append([indent, cfg, None, path])
+                if spans is not None:
+                    spans[path][3] = indent
+        while indent < stack[-1][0]:
+            frame = stack.pop()
+            if spans is not None:
+                spans[frame[3]][2] = self.last_end
+
+        frame = stack[-1]
+        if indent > frame[0]:
+            # multi line values, append them to the last key
+            if not frame[2]:
+                raise ValueError, "Extra indent, but no lastkey, line %d" % self.lineno
+            cfg = frame[1]
+            cfg._load(frame[2], "%s %s" % (cfg[frame[2]], right))
+            if spans is not None:
+                path = frame[3] + (frame[2],)
+                if self.last_path == path and spans[path]:
+                    spans[path][1] = self.offset
+                else:
+                    # the lines of the value are not next to each other
+                    spans[path] = False
+                self.last_path = path
+        elif right[-1] == ':':
+            # new section
+            section = right[:-1].strip()
+            if not section:
+                raise ValueError, "Empty section, line %d" % self.lineno
+            cfg = ConfigFile()
+            frame[1]._load(section, cfg)
+            path = None
+            if spans is not None:
+                path = frame[3] + (section,)
+                if path in spans:
+                    # the keys of the first section can't be found anymore
+                    self.patchable = False
+                spans[path] = [self.start, self.offset, self.offset, frame[0] + 4]
+                self.last_path = path
+            self.pending = (cfg, path)
+        else:
+            # a key value combination
+            key, sep, val = right.partition('=')
+            key = key.strip()
+            frame[1]._load(key, val.strip())
+            frame[2] = key
+            if spans is not None:
+                path = frame[3] + (key,)
+                spans[path] = [self.start, self.offset]
+                self.last_path = path
+        self.last_end = self.offset
+
+    def close(self):
+        if self.buffer:
+            line = "".join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+            self.parse_line(line)
+        self.pending = None
+        if self.spans is not None:
+            for frame in self.stack[1:]:
+                self.spans[frame[3]][2] = self.last_end
+            self.spans[()] = [0, self.offset, self.offset, 0]
+        del self.stack[1:]
+        return self.cfg
@@ -91,14 +91,11 @@ The following table is used to map the resolvers.
 from __future__ import absolute_import
 
 import re
+import string
 import sys
 import collections
 import logging
 import os
-import hashlib
-import base64
-import json
-import datetime
 
 from . import configfile
 from . import basesettings
@@ -110,7 +107,7 @@ __all__ = ['SettingsResolver' , 'IntSettingsResolver', 'FloatSettingsResolver',
             'PassSettingsResolver', 'SecretSettingsResolver', 'DateSettingsResolver', 'TimeSettingsResolver',
             'DatetimeSettingsResolver', 
             'TupleSettingsResolver', 'NamedTupleSettingsResolver', 'ListSettingsResolver', 'DictSettingsResolver',
-            'SectionSettingsResolver', 'ResolveException']
+            'SectionSettingsResolver', 'FormatTemplate', 'ResolveException']
 
 class ResolveException(Exception):
     pass
@@ -130,7 +127,14 @@ class SettingsResolver(object):
     """ True is the get value can hold childs, else False."""
     
     resolve_types = ('default',)
-    """ The string types and real type this resolver supports."""
+    """ The string types and real type this resolver supports. Types from modules that are
+    not imported up front can be given by their full name, like ``'datetime.date'``."""
+    
+    resolve_suffixes = ()
+    """ The endings of setting names this resolver supports, used by the default ``_supports``."""
+    
+    key = None
+    """ The key this resolver belongs to, set by the section that created it. None for child resolvers."""
     
     def __init__(self , settings, validate=None):
         self.settings = settings
@@ -187,6 +191,32 @@ class SettingsResolver(object):
         """
         return True
     
+    def cacheable(self, value):
+        """ Checks if the result of ``get(value)`` may be cached by the settingsobject.
+        
+        A result may only be cached if it depends on nothing else than ``value``.
+        
+        :param value: The raw value passed to `get`
+        :type value: `str` of final type
+        :return: Returns True if the resolved value can be cached else False.
+        :rtype: ``bool``
+        """
+        return True
+    
+    @classmethod
+    def references(cls, value):
+        """ Returns the paths of the settings ``get(value)`` depends on.
+        
+        The settingsobject uses this to drop cached values when a referenced 
+        setting changes and to detect circular references.
+        
+        :param value: The raw value passed to `get`
+        :type value: `str` of final type
+        :return: Dotted paths, starting at the root settingsobject.
+        :rtype: ``tuple``
+        """
+        return ()
+    
     @classmethod
     def supports(cls, type=None, key=None, default=None):
         """ Checks of this Resolver supports a settings attribute base on type, attribute key and default value.
@@ -208,12 +238,20 @@ class SettingsResolver(object):
                 return True
         except:
             pass
-        return type in cls.resolve_types
+        if type in cls.resolve_types:
+            return True
+        name = getattr(type, '__name__', None)
+        return name is not None and '{}.{}'.format(type.__module__, name) in cls.resolve_types
     
     @classmethod
     def _supports(cls, key, default):
-        """ Checks of this Resolver supports a settings attribute base on attribute key and default value."""
-        return False
+        """ Checks of this Resolver supports a settings attribute base on attribute key and default value.
+        
+        The default implementation checks if the key ends with one of ``resolve_suffixes``. 
+        Settings use an index build from ``resolve_types`` and ``resolve_suffixes`` to find
+        resolvers, only override this function if the index can't express the rule.
+        """
+        return isinstance(key, basestring) and key.lower().endswith(cls.resolve_suffixes)
 
 class IntSettingsResolver(SettingsResolver):
     """ Resolver to coerce values to `int`
@@ -320,6 +358,61 @@ class BoolSettingsResolver(IntSettingsResolver):
         elif value in self.YES_VALUES:
             return True
 
+class FormatTemplate(object):
+    """ A format string parsed in literal pieces and references to other settings.
+    
+    Parsing is done once, formatting only joins the pieces and the values of the
+    references. A reference is the full (dotted) path of a setting starting at
+    the root, like ``{SECTION.KEY}``, and can have a conversion and a format spec
+    like `str.format`: ``{PORT:05d}``.
+    
+    :param value: The format string
+    :type value: ``str``
+    """
+    __slots__ = ('text', 'pieces', 'references')
+    
+    REFERENCE_REGEX = re.compile(r'^[0-9A-Za-z_]+(\.[0-9A-Za-z_]+)*$')
+    
+    _formatter = string.Formatter()
+    
+    def __init__(self, value):
+        self.pieces = []
+        references = []
+        for literal, path, spec, conversion in self._formatter.parse(value):
+            if literal:
+                self.pieces.append(literal)
+            if path is None:
+                continue
+            if not self.REFERENCE_REGEX.match(path):
+                raise ResolveException("Not a valid reference to a setting : {{{path}}} in {value!r}".format(path=path, value=value))
+            self.pieces.append((path, conversion, spec))
+            references.append(path)
+        self.references = tuple(references)
+        self.text = "".join(self.pieces) if not references else None
+    
+    def format(self, get):
+        """ Format the template.
+        
+        :param get: Callable returning the value of a reference (dotted path)
+        :type get: ``callable``
+        :return: The formatted string
+        :rtype: ``str``
+        """
+        if self.text is not None:
+            return self.text
+        parts = []
+        for piece in self.pieces:
+            if isinstance(piece, tuple):
+                path, conversion, spec = piece
+                value = get(path)
+                if conversion == 'r':
+                    value = repr(value)
+                elif conversion == 's':
+                    value = str(value)
+                piece = format(value, spec)
+            parts.append(piece)
+        return "".join(parts)
+
 class StrSettingsResolver(SettingsResolver):
     """ Resolver to coerce values to `str`.
     
@@ -336,14 +429,22 @@ class StrSettingsResolver(SettingsResolver):
             PORT = 5589
             HOST = '{HOST}:{PORT}'
     
+    Values are parsed once in a `FormatTemplate`, templates are cached
+    by value.
+    
     :param choices: List of valid strings for this setting
     :type choices: ``list``
     """
     
     SETTING_REGEX = '\{([1-9A-Z_\.]+)\}'
     
+    TEMPLATE_CACHE_SIZE = 1024
+    """ Maximum number of templates that are cached."""
+    
     resolve_types = ('str', str)
     
+    _templates = {}
+    
     def __init__(self, settings, validate=None, choices=None):
         super(StrSettingsResolver, self).__init__(settings, validate)
         self.choices = choices
@@ -356,13 +457,28 @@ class StrSettingsResolver(SettingsResolver):
         :return: Value as string, value replace is done.
         :rtype: ``str``
         """
-        value = str(value)
-        if re.search(self.SETTING_REGEX, value):
-            kwargs = dict((v.split('.')[0] , self.settings.root.get(v.split('.')[0])) for v in re.findall(self.SETTING_REGEX, value))
-        else:
-            kwargs = {}
+        return self.compile(str(value)).format(self.settings.root._reference)
+    
+    @classmethod
+    def references(cls, value):
+        """ Returns the references of the template of ``value``."""
+        return cls.compile(str(value)).references
+    
+    @classmethod
+    def compile(cls, value):
+        """ Returns the (cached) `FormatTemplate` of value.
         
-        return value.format(**kwargs)
+        :param value: The format string
+        :type value: ``str``
+        :rtype: `FormatTemplate`
+        """
+        try:
+            return cls._templates[value]
+        except KeyError:
+            if len(cls._templates) >= cls.TEMPLATE_CACHE_SIZE:
+                cls._templates.clear()
+            template = cls._templates[value] = FormatTemplate(value)
+            return template
     
     def _validate(self, value):
         """ Validate if value is in choices (if choices was supplied)
@@ -416,8 +532,7 @@ class PathSettingsResolver(StrSettingsResolver):
     resolve_types = ('path',)
     
     def __init__(self, settings, validate=None):
-        super(StrSettingsResolver, self).__init__(settings, validate)
-        self.choices = choices
+        super(PathSettingsResolver, self).__init__(settings, validate)
     
     def get(self, value):
         """ Coerce ``value`` to proper path.
@@ -451,6 +566,7 @@ class DirSettingsResolver(PathSettingsResolver):
     """
     
     resolve_types = ('dir',)
+    resolve_suffixes = ('dir',)
     
     def __init__(self, settings, validate=None, create=True):
         super(DirSettingsResolver, self).__init__(settings, validate)
@@ -471,11 +587,6 @@ class DirSettingsResolver(PathSettingsResolver):
         if self.create and not os.path.isdir(value):
             os.makedirs(value)
         return value
-    
-    @classmethod
-    def _supports(self, key=None, default=None):
-        return key.lower().endswith('dir')
-                
 
 class FileSettingsResolver(PathSettingsResolver):
     """ Resolver to proper return dir-paths based on platform.
@@ -497,6 +608,7 @@ class FileSettingsResolver(PathSettingsResolver):
     """
     
     resolve_types = ('file',)
+    resolve_suffixes = ('file',)
     
     def __init__(self, settings, validate=None, create=False, create_dir=True, file_ext=None):
         super(FileSettingsResolver, self).__init__(settings, validate)
@@ -527,10 +639,6 @@ class FileSettingsResolver(PathSettingsResolver):
         if self.file_ext and not value.endswith(self.file_ext):
             return False
         return super(FileSettingsResolver, self)._validate(value)
-    
-    @classmethod
-    def _supports(cls, key=None, default=None):
-        return key.lower().endswith('file')
 
 class SecretSettingsResolver(SettingsResolver):
     """ Resolver that encrypts value before storing it.
@@ -565,6 +673,10 @@ class SecretSettingsResolver(SettingsResolver):
         dec = self.decrypte(self.get_secret(), value)
         return super(SecretSettingsResolver , self).get(dec)
     
+    def cacheable(self, value):
+        """ The secret can change, so the decrypted value is never cached."""
+        return False
+    
     def raw(self, value):
         """ Return encrypted text."""
         return self.encrypte(self.get_secret(), value)
@@ -592,6 +704,7 @@ class SecretSettingsResolver(SettingsResolver):
         :return: Return encrypted text, baseencoded.
         :rtype: ``str``
         """
+        import base64
         enc = []
         for i in range(len(clear)):
             key_c = key[i % len(key)]
@@ -612,6 +725,7 @@ class SecretSettingsResolver(SettingsResolver):
         :return: Return encrypted text, baseencoded.
         :rtype: ``str``
         """
+        import base64
         dec = []
         enc = base64.urlsafe_b64decode(enc)
         for i in range(len(enc)):
@@ -645,6 +759,7 @@ class PassSettingsResolver(SettingsResolver):
     """
     
     resolve_types = ('pass','password')
+    resolve_suffixes = ('password',)
     
     class Password(object):
         def __init__(self, password, hasher, salt):
@@ -698,6 +813,7 @@ class PassSettingsResolver(SettingsResolver):
         :return: Return hashed password, (as hexdigest).
         :rtype: ``str``
         """
+        import hashlib
         if callable(salt):
             salt = salt(value)
         return hashlib.sha256('{}.{}'.format(value,salt)).hexdigest()
@@ -712,10 +828,6 @@ class PassSettingsResolver(SettingsResolver):
         :rtype: ``str``
         """
         return 'default'
-    
-    @classmethod
-    def _supports(self, key=None, default=None):
-        return key.lower().endswith('password')
 
 class TimeDeltaSettingsResolver(SettingsResolver):
     """ Resolver to coerce value to TimeDelta object.
@@ -725,7 +837,7 @@ class TimeDeltaSettingsResolver(SettingsResolver):
     :type min: ``timedelta``
     :type max: ``timedelta``
     """
-    resolve_types = ('timedelta', datetime.timedelta)
+    resolve_types = ('timedelta', 'datetime.timedelta')
     
     def __init__(self, settings, validate=None, min=None, max=None):
         super(TimeDeltaSettingsResolver, self).__init__(settings, validate)
@@ -733,6 +845,7 @@ class TimeDeltaSettingsResolver(SettingsResolver):
         self.max = max
 
     def get(self, value):
+        import datetime
         if isinstance(value, datetime.timedelta):
             return value
         return datetime.timedelta(seconds=int(value))
@@ -756,7 +869,7 @@ class DatetimeSettingsResolver(SettingsResolver):
     :type max: ``datetime``
     """
     
-    resolve_types = ('datetime', datetime.datetime)
+    resolve_types = ('datetime', 'datetime.datetime')
     format = "%Y-%m-%d %H:%M:%S"
     
     def __init__(self, settings, validate=None, min=None, max=None):
@@ -765,6 +878,7 @@ class DatetimeSettingsResolver(SettingsResolver):
         self.max = max
     
     def get(self, value):
+        import datetime
         if isinstance(value, datetime.datetime):    
             return value
         return datetime.datetime.strptime(value, self.format)
@@ -785,10 +899,11 @@ class TimeSettingsResolver(DatetimeSettingsResolver):
     Take the same args as `DatetimeSettingsResolver` only
     with time objects.
     """
-    resolve_types = ('time', datetime.time)
+    resolve_types = ('time', 'datetime.time')
     format = "%H:%M:%S"
     
     def get(self, value):
+        import datetime
         if isinstance(value, datetime.time):    
             return value
         return super(TimeSettingsResover, self).get(value).time()
@@ -799,10 +914,11 @@ class DateSettingsResolver(DatetimeSettingsResolver):
     Take the same args as `DatetimeSettingsResolver` only
     with date objects.
     """
-    resolve_types = ('date', datetime.date)
+    resolve_types = ('date', 'datetime.date')
     format = "%Y-%m-%d"
     
     def get(self, value):
+        import datetime
         if isinstance(value, datetime.time):    
             return value
         return super(DateSettingsResolver, self).get(value).date()
@@ -812,6 +928,10 @@ class MultiValueSettingsResolver(SettingsResolver):
     multivalue = True
     resolvers = False
     
+    def cacheable(self, value):
+        """ Childs can hold formatted strings or sync back to the settingsobject, never cached."""
+        return False
+    
     def has_childs(self):
         """ Checks if child resolvers are already set on a multivalue resolver
         
@@ -885,7 +1005,7 @@ class TupleSettingsResolver(MultiValueSettingsResolver):
         for i,v in enumerate(value):
             l.append(self.resolvers[i].raw(v))
             if self.delimiter in l[i]:
-                logger.warning("Delimiter in raw value, key : {key}, value : {value}".format(key=ReferenceResolverMixin.get_key(self), value=value))
+                logger.warning("Delimiter in raw value, key : {key}, value : {value}".format(key=self.key, value=value))
         return self.delimiter.join(l)
     
     def _validate(self, value):
@@ -930,9 +1050,7 @@ class ReferenceResolverMixin(object):
     :rtype: ``str``
     """
     def get_key(self):  
-        for key, resolver in self.settings.resolvers.items():
-            if self is resolver:
-                return key
+        return self.key
         
 class ListSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
     """ Resolver to coerce value to ``list``
@@ -974,7 +1092,8 @@ class ListSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
         def __sync(self):
             " This function makes sure that we write all changes to the list back to the userfile. "
             self.__sort()
-            self._settings.userconfig[self._key.lower()] = self._resolver._raw(self._l)
+            self._settings._store(self._key, self._resolver._raw(self._l))
+            self._settings._invalidate(self._key)
         
         def append(self, v):
             self._l.append(self._resolver.resolver.get(v))
@@ -1100,6 +1219,7 @@ class ListSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
     
     def _get(self, values):
         """ Internal function to coerce value to `list`"""
+        import json
         l = []
         for val in json.loads(values):
             l.append(self.resolver.get(val))
@@ -1112,6 +1232,7 @@ class ListSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
     
     def _raw(self, values):
         """ Internal function to coerce list to `str`"""
+        import json
         return json.dumps([self.resolver.raw(value) for value in values])
     
     def _validate(self, values):
@@ -1167,7 +1288,8 @@ class DictSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
         
         def __sync(self):
             " This function makes sure that we write all changes to the list back to the userfile. "
-            self._settings.userconfig[self._key.lower()] = self._resolver._raw(self._d)
+            self._settings._store(self._key, self._resolver._raw(self._d))
+            self._settings._invalidate(self._key)
         
         def copy(self):
             return self._d.copy()
@@ -1284,6 +1406,7 @@ class DictSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
     
     def _get(self, value):
         """ Internal function to coerce json to `dict`"""
+        import json
         return json.loads(value)
     
     def raw(self,value):
@@ -1293,6 +1416,7 @@ class DictSettingsResolver(MultiValueSettingsResolver, ReferenceResolverMixin):
     
     def _raw(self, value):
         """ Internal function to coerce dict to `str`"""
+        import json
         return json.dumps(value)
     
     def _validate(self, value):
@@ -1310,6 +1434,11 @@ class SectionSettingsResolver(SettingsResolver, ReferenceResolverMixin):
     
     def get(self, value):
         key = self.get_key()
+        try:
+            return self.settings._sections[key.lower()]
+        except KeyError:
+            pass
+        
         if isinstance(value, basesettings.Section):
             # the default is passed 
             section = value
@@ -1329,10 +1458,8 @@ class SectionSettingsResolver(SettingsResolver, ReferenceResolverMixin):
         # try to get the this section form a the config files, if it does not exist we pass.
         fileconfigs = []
         for cfg in self.settings.fileconfigs:
-            try:
+            if key.lower() in cfg:
                 fileconfigs.append(cfg[key.lower()])
-            except KeyError:
-                pass
         
         try:
             options = self.settings.options[key.lower()]
@@ -1344,32 +1471,41 @@ class SectionSettingsResolver(SettingsResolver, ReferenceResolverMixin):
         except KeyError:
             envconfig = self.settings.envconfig[key.lower()] = {}
         
-        return section(self.settings, options, userconfig, nosave, envconfig, fileconfigs)
+        section = section(self.settings.root, options, userconfig, nosave, envconfig, fileconfigs)
+        section._path = self.settings._join(key.lower())
+        self.settings._add_section(key.lower(), section)
+        return section
     
     def raw(self, value): 
         raise ResolveException("It is not possible to set a section")
     
+    def cacheable(self, value):
+        """ Sections are kept by the parent section itself, see `Section._add_section`."""
+        return False
+    
     @classmethod
     def _supports(cls, key=None, default=None):
         return issubclass(default, basesettings.Section)
 
 # register all resolvers with base settings cls
-basesettings.add_resolver_type(SettingsResolver)
-basesettings.add_resolver_type(IntSettingsResolver)
-basesettings.add_resolver_type(FloatSettingsResolver)
-basesettings.add_resolver_type(BoolSettingsResolver)
-basesettings.add_resolver_type(StrSettingsResolver)
-basesettings.add_resolver_type(UnicodeSettingsResolver)
-basesettings.add_resolver_type(PathSettingsResolver)
-basesettings.add_resolver_type(DirSettingsResolver)
-basesettings.add_resolver_type(FileSettingsResolver)
-basesettings.add_resolver_type(SecretSettingsResolver)
-basesettings.add_resolver_type(PassSettingsResolver)
-basesettings.add_resolver_type(DatetimeSettingsResolver)
-basesettings.add_resolver_type(TimeSettingsResolver)
-basesettings.add_resolver_type(DateSettingsResolver)
-basesettings.add_resolver_type(TupleSettingsResolver)
-basesettings.add_resolver_type(NamedTupleSettingsResolver)
-basesettings.add_resolver_type(ListSettingsResolver)
-basesettings.add_resolver_type(DictSettingsResolver)
-basesettings.add_resolver_type(SectionSettingsResolver)
+basesettings.add_builtin_resolver_types([
+    SettingsResolver,
+    IntSettingsResolver,
+    FloatSettingsResolver,
+    BoolSettingsResolver,
+    StrSettingsResolver,
+    UnicodeSettingsResolver,
+    PathSettingsResolver,
+    DirSettingsResolver,
+    FileSettingsResolver,
+    SecretSettingsResolver,
+    PassSettingsResolver,
+    DatetimeSettingsResolver,
+    TimeSettingsResolver,
+    DateSettingsResolver,
+    TupleSettingsResolver,
+    NamedTupleSettingsResolver,
+    ListSettingsResolver,
+    DictSettingsResolver,
+    SectionSettingsResolver,
+])
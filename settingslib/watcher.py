@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#Copyright (c) 2014 Loek Wensveen
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+
+
+""" 
+=============
+File watcher
+=============
+
+Used by `BaseSettings` to reload config files that changed, see 
+``BaseSettings.watch_interval``.
+
+The watcher checks the files every interval. On Linux it also uses 
+inotify (through ctypes, no extra packages are needed) to wake up as 
+soon as a file in the directory of a watched file changes. A wake up 
+only means a check, which files changed is decided by the check itself.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+import select
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+# inotify events that can change a file, a file replaced by a rename is moved to
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+IN_CLOEXEC = 0o2000000
+
+class Inotify(object):
+    """ Waits for changes in directories using the inotify api of Linux.
+    
+    :raises OSError: If inotify is not available
+    """
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        import ctypes
+        try:
+            # the symbols of the process, libc included
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            init = self.libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available")
+        self.fd = init(os.O_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = set()
+    
+    def watch(self, directory):
+        """ Wake up on changes in ``directory``, a directory that does not exist is ignored."""
+        if directory in self.directories:
+            return
+        if self.libc.inotify_add_watch(self.fd, directory, IN_EVENTS) >= 0:
+            self.directories.add(directory)
+    
+    def wait(self, timeout):
+        """ Wait until something changed or ``timeout`` seconds passed."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # the events are not used, only that they happened
+            try:
+                while os.read(self.fd, 64 * 1024):
+                    pass
+            except OSError:
+                pass
+    
+    def close(self):
+        os.close(self.fd)
+
+class Watcher(object):
+    """ Calls ``check`` in a background thread each time one of the files
+    returned by ``files`` may have changed, at least every ``interval`` seconds.
+    
+    Errors raised by ``check`` are logged.
+    
+    :param check: Function called without arguments
+    :param files: Function returning the paths of the files to watch
+    :param interval: Seconds between two checks
+    :type check: ``callable``
+    :type files: ``callable``
+    :type interval: ``float``
+    """
+    def __init__(self, check, files, interval):
+        self.check = check
+        self.files = files
+        self.interval = interval
+        self.stopped = threading.Event()
+        try:
+            self.inotify = Inotify()
+        except OSError:
+            self.inotify = None
+        self.thread = threading.Thread(target=self.run, name='settingslib-watcher')
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                if self.inotify is not None:
+                    for path in self.files():
+                        self.inotify.watch(os.path.dirname(os.path.abspath(path)))
+                    self.inotify.wait(self.interval)
+                else:
+                    self.stopped.wait(self.interval)
+                if self.stopped.is_set():
+                    break
+                try:
+                    self.check()
+                except Exception:
+                    logger.exception("Reloading the config files failed")
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+    
+    def stop(self):
+        """ Stop the thread, waits at most one interval."""
+        self.stopped.set()
+        self.thread.join()
@@ -27,10 +27,14 @@
 from __future__ import absolute_import
 
 # system imports
+import os
+import tempfile
+import threading
+import time
 
 from . import basetest
 
-from settingslib.basesettings import BaseSettings, Section, Option, Resolver
+from settingslib.basesettings import BaseSettings, Section, Option, Resolver, SettingsException
 import settingslib.configfile as configfile
 
 class BaseSettingsTestCase(basetest.BaseTestCase):
@@ -102,4 +106,524 @@ class BaseSettingsTestCase(basetest.BaseTestCase):
         settings = Settings()
         self.assertEqual(settings.SOMETHING, 1)
         self.assertEqual(settings.help_dict['something'], "hello I am some help message")
-    
\ No newline at end of file
+            
+    def test_cache(self):
+        class Settings(BaseSettings):
+            use_cache = True
+            SOMETHING = 1
+            SOMESTR = "hello"
+            FORMAT = "{SOMESTR} world"
+        
+        settings = Settings()
+        self.assertEqual(settings.SOMETHING, 1)
+        self.assertEqual(settings.__dict__['SOMETHING'], 1)
+        self.assertEqual(settings.FORMAT, "hello world")
+        self.assertTrue('FORMAT' in settings.__dict__)
+        
+        settings.SOMETHING = 2
+        self.assertFalse('SOMETHING' in settings.__dict__)
+        self.assertEqual(settings.SOMETHING, 2)
+        
+        settings.SOMESTR = "bye"
+        self.assertEqual(settings.FORMAT, "bye world")
+        
+        del settings.SOMETHING
+        self.assertEqual(settings.SOMETHING, 1)
+        
+        settings.set_options({"something": 3})
+        self.assertEqual(settings.SOMETHING, 3)
+        settings.set_options({})
+        self.assertEqual(settings.SOMETHING, 1)
+    
+    def test_cache_mixed(self):
+        # a cached value that references a setting through a section that doesn't cache
+        class Settings(BaseSettings):
+            use_cache = True
+            A = '{SUB.B}'
+            C = 'c'
+            class SUB(Section):
+                use_cache = False
+                B = '{C}'
+        
+        settings = Settings()
+        self.assertEqual(settings.A, 'c')
+        settings.C = 'x'
+        self.assertEqual(settings.SUB.B, 'x')
+        self.assertEqual(settings.A, 'x')
+        
+        # and the other way around
+        class Settings(BaseSettings):
+            A = '{C}'
+            C = 'c'
+            class SUB(Section):
+                use_cache = True
+                B = '{A}'
+        
+        settings = Settings()
+        self.assertEqual(settings.SUB.B, 'c')
+        settings.C = 'x'
+        self.assertEqual(settings.A, 'x')
+        self.assertEqual(settings.SUB.B, 'x')
+    
+    def test_cache_cfgfile(self):
+        class Settings(BaseSettings):
+            use_cache = True
+            SOMETHING = 1
+            OTHER = 1
+        
+        settings = Settings()
+        self.assertEqual(settings.SOMETHING, 1)
+        self.assertEqual(settings.OTHER, 1)
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 5\n")
+            settings.add_cfgfile(file)
+            self.assertEqual(settings.SOMETHING, 5)
+            self.assertTrue('OTHER' in settings.__dict__)
+            
+            settings.set_userfile(file)
+            self.assertEqual(settings.userconfig['something'], "5")
+            settings.SOMETHING = 6
+            settings.set_userfile(file)
+            self.assertEqual(settings.SOMETHING, 5)
+        finally:
+            os.remove(file)
+    
+    def test_index(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            OTHER = 1
+        
+        settings = Settings()
+        files = []
+        try:
+            for i in range(3):
+                fd, file = tempfile.mkstemp()
+                files.append(file)
+                with os.fdopen(fd, 'w') as fp:
+                    fp.write("something = {}\n".format(i))
+                settings.add_cfgfile(file)
+                self.assertEqual(settings.SOMETHING, i)
+            self.assertEqual(settings.OTHER, 1)
+            self.assertEqual(settings._index['something'], (settings.fileconfigs[0], "2"))
+            self.assertEqual(settings._index['other'], (settings.defaults, 1))
+            
+            settings.SOMETHING = 4
+            self.assertFalse('something' in settings._index)
+            self.assertEqual(settings.SOMETHING, 4)
+            self.assertTrue(settings._index['something'][0] is settings.userconfig)
+        finally:
+            for file in files:
+                os.remove(file)
+    
+    def test_section_reuse(self):
+        class Settings(BaseSettings):
+            class SUBSECTION(Section):
+                SOM = 1
+                class SUBSUBSECTION(Section):
+                    SOM = 2
+        
+        settings = Settings()
+        section = settings.SUBSECTION
+        self.assertTrue(settings.SUBSECTION is section)
+        self.assertTrue(settings.SUBSECTION.SUBSUBSECTION is section.SUBSUBSECTION)
+        self.assertTrue(section.SUBSUBSECTION.root is settings)
+        
+        settings.set_options({"subsection.som": 3})
+        self.assertFalse(settings.SUBSECTION is section)
+        self.assertEqual(settings.SUBSECTION.SOM, 3)
+        
+        settings.max_sections = 0
+        settings._invalidate('subsection')
+        self.assertFalse(settings.SUBSECTION is settings.SUBSECTION)
+    
+    def test_schema(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            SOME = Option(1, 'int', solid=True)
+            class SUBSECTION(Section):
+                SOM = 1
+        
+        settings = Settings()
+        other = Settings()
+        self.assertTrue(settings.extraOptions is other.extraOptions)
+        self.assertTrue(settings.extraOptions['some']['solid'])
+        self.assertRaises(SettingsException, settings.extraOptions['some'].__setitem__, 'solid', False)
+        self.assertRaises(SettingsException, settings.extraOptions.pop, 'some')
+        self.assertEqual(settings.resolvers.keys(), [])
+        self.assertEqual(settings.SOMETHING, 1)
+        self.assertEqual(settings.resolvers.keys(), ['something'])
+        self.assertFalse(settings.resolvers['something'] is other.resolvers['something'])
+    
+    def test_freeze(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            SOMESTR = "{SOMETHING} thing"
+            SOMELIST = [1]
+            SOMEDICT = {'a' : [1]}
+            class SUBSECTION(Section):
+                SOM = 1
+        
+        settings = Settings()
+        frozen = settings.freeze()
+        self.assertEqual(frozen.SOMETHING, 1)
+        self.assertEqual(frozen.SOMESTR, "1 thing")
+        self.assertEqual(frozen.SUBSECTION.SOM, 1)
+        self.assertEqual(frozen.get('subsection.som'), 1)
+        self.assertTrue(frozen.has('subsection.som'))
+        self.assertFalse(frozen.has('subsection.nothing'))
+        self.assertEqual(frozen.get_dict(), {'SOMETHING' : 1, 'SOMESTR' : "1 thing", 'SOMELIST' : (1,), 'SOMEDICT' : {'a' : (1,)}, 'SUBSECTION' : {'SOM' : 1}})
+        self.assertEqual(type(frozen.SOMELIST), tuple)
+        
+        def assertExcept():
+            frozen.SOMETHING = 2
+        self.assertRaises(SettingsException, assertExcept)
+        self.assertRaises(SettingsException, frozen.SOMEDICT.__setitem__, 'b', 2)
+        self.assertRaises(SettingsException, frozen.SOMEDICT.update, b=2)
+        self.assertRaises(AttributeError, getattr, frozen.SOMEDICT['a'], 'append')
+        
+        settings.SOMETHING = 2
+        self.assertEqual(frozen.SOMESTR, "1 thing")
+        self.assertEqual(settings.freeze().SOMESTR, "2 thing")
+    
+    def test_delele(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            class SUBSECTION(Section):
+                SOM = 1
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 5\nsubsection:\n    som = 6\n")
+            settings = Settings(cfgfiles=[file])
+            settings.set('subsection.som', 7)
+            settings.delele('subsection.som')
+            self.assertEqual(settings.SUBSECTION.SOM, 6)
+            settings.delele('subsection.som', fileconfig=True)
+            self.assertEqual(settings.SUBSECTION.SOM, 1)
+            self.assertEqual(settings.SOMETHING, 5)
+            with open(file) as fp:
+                self.assertEqual(fp.read(), "something = 5\nsubsection:\n    som = 6\n")
+        finally:
+            os.remove(file)
+    
+    def test_dotted_paths(self):
+        class Settings(BaseSettings):
+            SOMETHING = Option(1, 'int', __doc__="something help")
+            class SUBSECTION(Section):
+                "subsection help"
+                class SUBSUBSECTION(Section):
+                    SOM = Option(1, 'int', __doc__="som help")
+        
+        settings = Settings()
+        self.assertEqual(settings.get('subsection.subsubsection.som'), 1)
+        self.assertEqual(settings.get('SUBSECTION.SUBSUBSECTION.SOM'), 1)
+        settings.set('subsection.subsubsection.som', 2)
+        self.assertEqual(settings.SUBSECTION.SUBSUBSECTION.SOM, 2)
+        self.assertEqual(settings.userconfig['subsection']['subsubsection']['som'], "2")
+        
+        self.assertTrue(settings.has('subsection.subsubsection.som'))
+        self.assertTrue(settings.has('subsection'))
+        self.assertFalse(settings.has('subsection.som'))
+        self.assertRaises(AttributeError, settings.get, 'subsection.som')
+        
+        self.assertEqual(settings.help('something'), "something help")
+        self.assertEqual(settings.help('subsection'), "subsection help")
+        self.assertEqual(settings.help('subsection.subsubsection.som'), "som help")
+        self.assertEqual(settings.SUBSECTION.help('subsubsection.som'), "som help")
+        self.assertEqual(settings.help('nothing'), None)
+    
+    def test_bulk(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            SOMESTR = "{SOMETHING} thing"
+            OTHERSTR = "{SOMESTR} and {SUBSECTION.SOM}"
+            class SUBSECTION(Section):
+                SOM = 1
+                class SUBSUBSECTION(Section):
+                    SOM = 2
+        
+        settings = Settings()
+        self.assertEqual(settings.get_dict(), {'SOMETHING' : 1, 'SOMESTR' : "1 thing", 'OTHERSTR' : "1 thing and 1", 
+                                               'SUBSECTION' : {'SOM' : 1, 'SUBSUBSECTION' : {'SOM' : 2}}})
+        items = dict(settings.iter_items())
+        self.assertEqual(items, {'something' : 1, 'somestr' : "1 thing", 'otherstr' : "1 thing and 1",
+                                 'subsection.som' : 1, 'subsection.subsubsection.som' : 2})
+        self.assertEqual(dict(settings.SUBSECTION.iter_items()), {'som' : 1, 'subsubsection.som' : 2})
+        self.assertEqual(sorted(settings.values()), sorted(dict(settings.items()).values()))
+        
+        lookups = []
+        get = settings.get
+        def counting_get(key):
+            lookups.append(key.lower())
+            return get(key)
+        settings.get = counting_get
+        settings.get_dict()
+        self.assertEqual(len(lookups), len(set(lookups)))
+        self.assertTrue(settings._state.memo is None)
+        
+        # each thread has its own memo, none is left behind
+        threads = [threading.Thread(target=settings.get_dict) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(settings._state.memo is None)
+    
+    def test_lazy_cfgfile(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            OTHER = 1
+            class SUBSECTION(Section):
+                SOM = 1
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 5\nsubsection:\n    som = 6\n")
+            settings = Settings(cfgfiles=[file])
+            config = settings.fileconfigs[0]
+            self.assertFalse(config.loaded())
+            self.assertEqual(settings.SOMETHING, 5)
+            self.assertTrue(config.loaded())
+            self.assertEqual(settings.SUBSECTION.SOM, 6)
+            
+            settings = Settings()
+            settings.add_cfgfile(file)
+            self.assertFalse(settings.fileconfigs[0].loaded())
+            self.assertEqual(settings.OTHER, 1)
+            self.assertTrue(settings.fileconfigs[0].loaded())
+            self.assertEqual(settings.SOMETHING, 5)
+        finally:
+            os.remove(file)
+        
+        # a file that can't be read fails each time, it is not read as empty
+        settings = Settings(cfgfiles=['/non/existing/file.conf'])
+        self.assertRaises(IOError, getattr, settings, 'SOMETHING')
+        self.assertRaises(IOError, getattr, settings, 'SOMETHING')
+        self.assertFalse(settings.fileconfigs[0].loaded())
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 5\n:\n")
+            settings = Settings(cfgfiles=[file])
+            self.assertRaises(ValueError, getattr, settings, 'SOMETHING')
+            self.assertRaises(ValueError, getattr, settings, 'SOMETHING')
+            self.assertFalse(settings.fileconfigs[0].loaded())
+        finally:
+            os.remove(file)
+    
+    def test_attr_doc(self):
+        class Settings(BaseSettings):
+            HELPED = 1
+            " helped help"
+            SOME = Option(1, 'int', __doc__="some help")
+            class SUBSECTION(Section):
+                HELPED_SOM = 1
+                " som help"
+        
+        self.assertFalse('_help_dict' in Settings.__dict__)
+        settings = Settings()
+        self.assertEqual(settings.help('helped'), " helped help")
+        self.assertEqual(settings.help('some'), "some help")
+        self.assertEqual(settings.help('subsection.helped_som'), " som help")
+        self.assertTrue(Settings.help_dict is settings.help_dict)
+        
+        # the module is only parsed once for all classes in it
+        import settingslib.basesettings as basesettings
+        self.assertTrue(__name__ in basesettings._module_classes)
+        self.assertTrue('Settings' in basesettings._module_classes[__name__])
+    
+    def test_journal(self):
+        class Settings(BaseSettings):
+            use_journal = True
+            SOMETHING = 1
+            TEXT = 'text'
+            class SUBSECTION(Section):
+                VALUE = 1
+        
+        fd, file = tempfile.mkstemp()
+        journal = file + '.journal'
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("# keep me\nsomething = 2\n")
+            settings = Settings()
+            settings.set_userfile(file)
+            settings.SOMETHING = 3
+            settings.TEXT = 'multi\nline'
+            settings.SUBSECTION.VALUE = 4
+            del settings.SOMETHING
+            with open(file) as fp:
+                self.assertEqual(fp.read(), "# keep me\nsomething = 2\n")
+            
+            # a record of a crash while writing is ignored
+            with open(journal, 'a') as fp:
+                fp.write("=text broken")
+            settings = Settings()
+            settings.set_userfile(file)
+            self.assertEqual(settings.SOMETHING, 1)
+            self.assertEqual(settings.TEXT, 'multi\nline')
+            self.assertEqual(settings.SUBSECTION.VALUE, 4)
+            settings.TEXT = 'other'
+            settings = Settings()
+            settings.set_userfile(file)
+            self.assertEqual(settings.TEXT, 'other')
+            
+            # the journal is folded into the file
+            settings.journal_size = 0
+            settings.SOMETHING = 5
+            self.assertEqual(os.path.getsize(journal), 0)
+            with open(file) as fp:
+                self.assertTrue(fp.read().startswith("# keep me\n"))
+            settings = Settings()
+            settings.set_userfile(file)
+            self.assertEqual(settings.SOMETHING, 5)
+            self.assertEqual(settings.SUBSECTION.VALUE, 4)
+        finally:
+            os.remove(file)
+            if os.path.exists(journal):
+                os.remove(journal)
+    
+    def test_autosave(self):
+        class Settings(BaseSettings):
+            autosave_interval = 0.1
+            SOMETHING = 1
+            OTHER = 1
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("# keep me\nsomething = 2\n")
+            settings = Settings()
+            settings.set_userfile(file)
+            saves = []
+            save = settings.save
+            settings.save = lambda: saves.append(save())
+            for i in range(20):
+                settings.SOMETHING = i
+            settings.OTHER = 5
+            # the setters don't save
+            self.assertEqual(saves, [])
+            time.sleep(0.5)
+            self.assertEqual(len(saves), 1)
+            with open(file) as fp:
+                self.assertEqual(fp.read(), "# keep me\nsomething = 19\nother = 5\n")
+            
+            # the last changes are saved when autosave is stopped
+            settings.OTHER = 6
+            settings.stop_autosave()
+            self.assertEqual(len(saves), 2)
+            with open(file) as fp:
+                self.assertEqual(fp.read(), "# keep me\nsomething = 19\nother = 6\n")
+        finally:
+            os.remove(file)
+    
+    def test_dirty(self):
+        class Settings(BaseSettings):
+            SOMETHING = 1
+            class SUBSECTION(Section):
+                VALUE = 1
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 2\n")
+            settings = Settings()
+            settings.set_userfile(file)
+            self.assertFalse(settings.is_dirty())
+            settings.SUBSECTION.VALUE = 3
+            self.assertTrue(settings.is_dirty())
+            self.assertTrue(settings.SUBSECTION.is_dirty())
+            settings.save()
+            self.assertFalse(settings.is_dirty())
+            self.assertFalse(settings.SUBSECTION.is_dirty())
+            
+            # a clean settingsobject does not write the file
+            with open(file, 'w') as fp:
+                fp.write("something = 4\n")
+            settings.save()
+            with open(file) as fp:
+                self.assertEqual(fp.read(), "something = 4\n")
+            
+            del settings.SOMETHING
+            self.assertTrue(settings.is_dirty())
+            self.assertFalse(settings.SUBSECTION.is_dirty())
+        finally:
+            os.remove(file)
+    
+    def test_reload(self):
+        changes = []
+        class Settings(BaseSettings):
+            use_cache = True
+            SOMETHING = Option(1, callback=lambda k, v : changes.append((k, v)))
+            OTHER = 1
+            COMBINED = Option('{SUBSECTION.VALUE}', callback=lambda k, v : changes.append((k, v)))
+            NAMES = Option(['a', 'b'], callback=lambda k, v : changes.append((k, v)))
+            class SUBSECTION(Section):
+                VALUE = 'a'
+        
+        fd, file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write("something = 2\nother = 3\n")
+            settings = Settings(cfgfiles=[file])
+            self.assertEqual(settings.SOMETHING, 2)
+            self.assertEqual(settings.COMBINED, 'a')
+            self.assertEqual(settings.reload(), [])
+            
+            # only the settings that depend on a changed key are resolved
+            resolved = []
+            value = settings._value
+            settings._value = lambda path : resolved.append(path) or value(path)
+            with open(file, 'w') as fp:
+                fp.write("something = 2\nother = 4\nsubsection:\n    value = bb\n")
+            self.assertEqual(sorted(settings.reload()), ['other', 'subsection'])
+            self.assertEqual(resolved, ['combined', 'combined'])
+            del settings._value
+            self.assertEqual(settings.OTHER, 4)
+            self.assertEqual(settings.SUBSECTION.VALUE, 'bb')
+            self.assertEqual(changes, [('COMBINED', 'bb')])
+            
+            # the section is kept, only the changed key is looked up again
+            section = settings.SUBSECTION
+            with open(file, 'w') as fp:
+                fp.write("something = 5\nother = 4\nsubsection:\n    value = ccc\n")
+            self.assertEqual(sorted(settings.reload()), ['something', 'subsection.value'])
+            self.assertTrue(settings.SUBSECTION is section)
+            self.assertEqual(settings.SUBSECTION.VALUE, 'ccc')
+            self.assertEqual(sorted(changes[1:]), [('COMBINED', 'ccc'), ('SOMETHING', 5)])
+            
+            # a reload between looking up a key and keeping it in the index
+            settings = Settings(cfgfiles=[file])
+            lookup = settings._lookup
+            def reloading_lookup(key):
+                found = lookup(key)
+                del settings._lookup
+                with open(file, 'w') as fp:
+                    fp.write("something = 5\nother = 42\n")
+                settings.reload()
+                return found
+            settings._lookup = reloading_lookup
+            self.assertEqual(settings.OTHER, 4)
+            self.assertEqual(settings.OTHER, 42)
+            
+            # the watcher reloads in the background
+            Settings.watch_interval = 0.05
+            settings = Settings(cfgfiles=[file])
+            try:
+                self.assertEqual(settings.SOMETHING, 5)
+                with open(file, 'w') as fp:
+                    fp.write("something = 66\n")
+                for i in range(40):
+                    if settings.SOMETHING == 66:
+                        break
+                    time.sleep(0.05)
+                self.assertEqual(settings.SOMETHING, 66)
+                self.assertEqual(settings.OTHER, 1)
+            finally:
+                settings.stop_watching()
+        finally:
+            os.remove(file)
@@ -27,10 +27,19 @@
 from __future__ import absolute_import
 
 import cStringIO as StringIO
+import marshal
+import os
+import shutil
+import tempfile
+import time
 
 from . import basetest
 
 from settingslib.configfile import ConfigFile
+import settingslib.configfile as configfile
+
+def tree(cfg):
+    return [(key, tree(value) if isinstance(value, ConfigFile) else value) for key, value in cfg.items()]
 
 class ConfigFileTestCase(basetest.BaseTestCase):
     def test_cmp(self):
@@ -172,4 +181,181 @@ class ConfigFileTestCase(basetest.BaseTestCase):
         self.assertEqual(cfg.section1.item1, "item 1")
         self.assertEqual(cfg.section1.subsection.item2, "item 2")
         self.assertEqual(cfg.section2.subsection.item3, "item 3")
-        self.assertEqual(cfg['very last'], "7")
\ No newline at end of file
+        self.assertEqual(cfg['very last'], "7")
+
+    def test_read_multiline(self):
+        fp = StringIO.StringIO(''.join([
+            'level1 = first\n',
+            '    second\n',
+            'section1:\n',
+            '\titem1 = item 1\n',
+            '\t\t  more\n',
+            '  # a comment\n',
+            '\n',
+            'empty section2:\n',
+        ]))
+        cfg = ConfigFile()
+        cfg.read(fp)
+        self.assertEqual(cfg.keys(), ['level1', 'section1', 'empty section2'])
+        self.assertEqual(cfg.level1, "first second")
+        self.assertEqual(cfg.section1.item1, "item 1 more")
+        self.assertEqual(cfg['empty section2'], ConfigFile())
+        self.assertRaises(ValueError, cfg.read, StringIO.StringIO('    item = 1\n'))
+
+    def test_feed(self):
+        with open(os.path.join(os.path.dirname(__file__), 'testfile.conf')) as fp:
+            data = fp.read()
+        cfg = ConfigFile()
+        cfg.read(StringIO.StringIO(data))
+        for size in [1, 7, len(data)]:
+            fed = ConfigFile()
+            parser = fed.parser()
+            for i in range(0, len(data), size):
+                parser.feed(data[i:i+size])
+            self.assertTrue(parser.close() is fed)
+            self.assertEqual(tree(fed), tree(cfg))
+        
+        parser = ConfigFile().parser(max_line=10)
+        parser.feed("key = 1\n")
+        parser.feed("other = ")
+        self.assertRaises(ValueError, parser.feed, "some long value")
+
+    def test_storage(self):
+        cfg = ConfigFile()
+        cfg['b'] = "1"
+        cfg['a'] = "2"
+        cfg.section.c = "3"
+        cfg['b'] = "4"
+        self.assertEqual(cfg.keys(), ['b', 'a', 'section'])
+        self.assertTrue('a' in cfg)
+        self.assertFalse('c' in cfg)
+        self.assertFalse(hasattr(cfg, '__dict__'))
+        del cfg['a']
+        self.assertEqual(cfg.items(), [('b', "4"), ('section', cfg.section)])
+        self.assertRaises(KeyError, cfg.__delitem__, 'a')
+        self.assertEqual(cfg.help('b'), "")
+
+    def test_write_stream(self):
+        class Writer(object):
+            def __init__(self):
+                self.parts = []
+            def write(self, data):
+                self.parts.append(data)
+        
+        cfg = ConfigFile()
+        cfg.section1.item1 = "first\nsecond"
+        cfg.section1.subsection.item2 = "item 2"
+        writer = Writer()
+        cfg.write(writer, "  ")
+        self.assertEqual(''.join(writer.parts), ''.join([
+            '  \n',
+            '  section1:\n',
+            '      item1 = first\n',
+            '      second\n',
+            '      \n',
+            '      subsection:\n',
+            '          item2 = item 2\n',
+        ]))
+
+    def test_read_mapped(self):
+        path = os.path.join(os.path.dirname(__file__), 'testfile.conf')
+        with open(path) as fp:
+            data = fp.read()
+        expected = ConfigFile()
+        expected.read(StringIO.StringIO(data))
+        
+        with open(path) as fp:
+            self.assertTrue(configfile.map_file(fp) is not None)
+            cfg = ConfigFile()
+            cfg.read(fp)
+            self.assertEqual(fp.read(), '')
+        self.assertEqual(tree(cfg), tree(expected))
+        
+        read, write = os.pipe()
+        with os.fdopen(write, 'w') as fp:
+            fp.write(data)
+        with os.fdopen(read) as fp:
+            self.assertTrue(configfile.map_file(fp) is None)
+            cfg = ConfigFile()
+            cfg.read(fp)
+        self.assertEqual(tree(cfg), tree(expected))
+        
+        cfg = ConfigFile()
+        parser = cfg.parser()
+        parser.parse_buffer("a = 1\n  # comment\n\f# comment\nb = 2\n    more\n  # last")
+        parser.close()
+        self.assertEqual(tree(cfg), [('a', "1"), ('b', "2 more")])
+
+    def test_read_cached(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'settings.conf')
+            with open(path, 'w') as fp:
+                fp.write("key = 1\nsection:\n    item = 2\n")
+            os.utime(path, (time.time() - 10, time.time() - 10))
+            
+            cfg = ConfigFile()
+            cfg.read_path(path, True)
+            self.assertEqual(tree(cfg), [('key', "1"), ('section', [('item', "2")])])
+            cached = configfile.cache_path(path)
+            self.assertTrue(os.path.exists(cached))
+            
+            # the cache is used while the file is not changed
+            with open(cached, 'rb') as fp:
+                key, data = marshal.load(fp)
+            with open(cached, 'wb') as fp:
+                marshal.dump((key, [('key', "cached")]), fp)
+            self.assertEqual(configfile.read_cached(path), [('key', "cached")])
+            
+            with open(path, 'a') as fp:
+                fp.write("other = 3\n")
+            self.assertEqual(configfile.read_cached(path)[-1], ('other', "3"))
+            
+            # a corrupt cache is ignored
+            with open(cached, 'wb') as fp:
+                fp.write("garbage")
+            self.assertEqual(configfile.read_cached(path)[0], ('key', "1"))
+            
+            cachedir = os.path.join(tmpdir, 'cache')
+            os.mkdir(cachedir)
+            cfg = configfile.LazyConfigFile(path, cachedir)
+            self.assertEqual(cfg.key, "1")
+            self.assertEqual(os.path.dirname(configfile.cache_path(path, cachedir)), cachedir)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_save_patch(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'settings.conf')
+            with open(path, 'w') as fp:
+                fp.write("# the key\nkey = 1\n\nsection:\n  # the item\n  item = 2\n  old = 3\n\n# end\n")
+            
+            cfg = ConfigFile()
+            cfg.read_file(path)
+            cfg.key = "changed"
+            cfg.section.new = "4"
+            del cfg.section.old
+            cfg.other.item = "5"
+            cfg.save(path)
+            with open(path) as fp:
+                self.assertEqual(fp.read(), "# the key\nkey = changed\n\nsection:\n  # the item\n  item = 2\n  new = 4\n\n# end\n\nother:\n    item = 5\n")
+            
+            # after a save the next changes are patched too
+            cfg.section.item = "6"
+            cfg.save(path)
+            with open(path) as fp:
+                self.assertTrue("  # the item\n  item = 6\n" in fp.read())
+            
+            # the file changed, the whole config is written
+            with open(path, 'a') as fp:
+                fp.write("extra = 7\n")
+            cfg.key = "8"
+            cfg.save(path)
+            other = ConfigFile()
+            other.read_file(path)
+            self.assertEqual(other, cfg)
+            with open(path) as fp:
+                self.assertFalse("# end" in fp.read())
+        finally:
+            shutil.rmtree(tmpdir)
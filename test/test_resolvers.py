@@ -27,6 +27,10 @@
 from __future__ import absolute_import
 
 # system imports
+import os
+import subprocess
+import sys
+import threading
 
 from . import basetest
 
@@ -160,4 +164,211 @@ class ResolverTestCase(basetest.BaseTestCase):
         self.assertEqual(settings.SUBSECTION.HEY2, 1)
         
         settings.SUBSECTION.HELLO = 'hello'
-        self.assertEqual(settings.SUBSECTION.HELLO, 'hello')
\ No newline at end of file
+        self.assertEqual(settings.SUBSECTION.HELLO, 'hello')
+    
+    def test_resolverindex(self):
+        class Settings(BaseSettings):
+            class SUBSECTION(Section):
+                pass
+        
+        def find(type_, key, default):
+            for cls in reversed(Section._resolverTypes):
+                if cls.supports(type_, key, default):
+                    return cls
+            for subtype in type_.__mro__:
+                for cls in reversed(Section._resolverTypes):
+                    if cls.supports(subtype, key, default):
+                        return cls
+        
+        cases = [(int, 'port', 1), (bool, 'debug', True), (str, 'name', 'hello'),
+                 (str, 'data_dir', 'data'), (str, 'log_file', 'log.txt'), (int, 'some_dir', 1),
+                 (str, 'admin_password', 'hash'), (unicode, 'name', u'hello'), (list, 'names', []),
+                 (tuple, 'pair', (1, 2)), (dict, 'mapping', {}), (type(Section), 'subsection', Settings.defaults['subsection']),
+                 ('int', None, None), ('file', None, None), ('tuple', None, None), ('default', None, None)]
+        for type_, key, default in cases:
+            if isinstance(type_, str):
+                self.assertEqual(Section._find_resolver(type_), find(type_, key, default))
+            else:
+                self.assertEqual(Section._find_resolver(type_, key, default), find(type_, key, default))
+        self.assertEqual(Section._find_resolver(str, 'data_dir', 'data'), resolvers.DirSettingsResolver)
+        self.assertEqual(Section._find_resolver('unknown'), resolvers.SettingsResolver)
+    
+    def test_add_resolver_type(self):
+        class UpperSettingsResolver(resolvers.StrSettingsResolver):
+            resolve_types = ('upper',)
+            resolve_suffixes = ('_upper',)
+            
+            def get(self, value):
+                return super(UpperSettingsResolver, self).get(value).upper()
+        
+        class Settings(BaseSettings):
+            NAME_UPPER = 'hello'
+        
+        types = list(Section._resolverTypes)
+        try:
+            basesettings.add_resolver_type(UpperSettingsResolver)
+            self.assertEqual(Settings().NAME_UPPER, 'HELLO')
+        finally:
+            Section._resolverTypes[:] = types
+            Section._resolverIndex = None
+        
+        # resolvers that override supports are still asked
+        class UrlSettingsResolver(resolvers.StrSettingsResolver):
+            @classmethod
+            def supports(cls, type=None, key=None, default=None):
+                return isinstance(default, str) and default.startswith('http://')
+            
+            def get(self, value):
+                return super(UrlSettingsResolver, self).get(value).rstrip('/')
+        
+        class Settings(BaseSettings):
+            HOME = 'http://example.com/'
+            NAME = 'example.com/'
+        
+        try:
+            basesettings.add_resolver_type(UrlSettingsResolver)
+            self.assertEqual(Settings().HOME, 'http://example.com')
+            self.assertEqual(Settings().NAME, 'example.com/')
+        finally:
+            Section._resolverTypes[:] = types
+            Section._resolverIndex = None
+    
+    def test_lazy_resolvers(self):
+        script = "\n".join([
+            "import sys",
+            "import settingslib",
+            "from settingslib.basesettings import BaseSettings",
+            "class Settings(BaseSettings):",
+            "    SOMETHING = 1",
+            "assert 'settingslib.resolvers' not in sys.modules",
+            "assert Settings().SOMETHING == 1",
+            "assert 'settingslib.resolvers' in sys.modules",
+            # the modules of resolvers that are not used are not imported
+            "for name in ['json', 'hashlib', 'base64', 'datetime']:",
+            "    assert name not in sys.modules, name",
+            "import datetime",
+            "class Settings(BaseSettings):",
+            "    DELAY = datetime.timedelta(seconds=5)",
+            "assert Settings().DELAY == datetime.timedelta(seconds=5)",
+        ])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root)
+        self.assertEqual(subprocess.call([sys.executable, '-c', script], env=env), 0)
+    
+    def test_resolverkey(self):
+        class Settings(BaseSettings):
+            SOMETHING = [1]
+            PAIR = ('str', 1)
+            class SUBSECTION(Section):
+                pass
+        
+        settings = Settings()
+        self.assertEqual(settings.resolvers['something'].get_key(), 'something')
+        self.assertEqual(settings.resolvers['something'].resolver.key, None)
+        self.assertEqual(settings.resolvers['pair'].key, 'pair')
+        self.assertEqual(settings.resolvers['subsection'].get_key(), 'subsection')
+        self.assertEqual(settings.SOMETHING._key, 'something')
+    
+    def test_formattemplate(self):
+        class Settings(BaseSettings):
+            PORT = 80
+            HOST = '{SUBSECTION.IP}:{PORT:05d}'
+            ESCAPED = '{{PORT}} is {PORT!r}'
+            class SUBSECTION(Section):
+                IP = '127.0.0.1'
+                URL = 'http://{HOST}/'
+        
+        settings = Settings()
+        self.assertEqual(settings.HOST, '127.0.0.1:00080')
+        self.assertEqual(settings.ESCAPED, '{PORT} is 80')
+        self.assertEqual(settings.SUBSECTION.URL, 'http://127.0.0.1:00080/')
+        
+        template = resolvers.StrSettingsResolver.compile('{SUBSECTION.IP}:{PORT:05d}')
+        self.assertTrue(template is resolvers.StrSettingsResolver.compile('{SUBSECTION.IP}:{PORT:05d}'))
+        self.assertEqual(template.references, ('SUBSECTION.IP', 'PORT'))
+        self.assertEqual(resolvers.StrSettingsResolver.compile('{{}}').text, '{}')
+        self.assertRaises(resolvers.ResolveException, resolvers.FormatTemplate, '{}')
+    
+    def test_references(self):
+        class Settings(BaseSettings):
+            use_cache = True
+            ROOT = 'root'
+            DATA = '{ROOT}/data'
+            OTHER = 'other'
+            class SUBSECTION(Section):
+                use_cache = True
+                LOG = '{DATA}/log'
+        
+        settings = Settings()
+        self.assertEqual(settings.SUBSECTION.LOG, 'root/data/log')
+        self.assertEqual(settings.OTHER, 'other')
+        self.assertTrue('LOG' in settings.SUBSECTION.__dict__)
+        
+        settings.OTHER = 'changed'
+        self.assertTrue('LOG' in settings.SUBSECTION.__dict__)
+        self.assertTrue('DATA' in settings.__dict__)
+        
+        settings.ROOT = 'new'
+        self.assertFalse('LOG' in settings.SUBSECTION.__dict__)
+        self.assertFalse('DATA' in settings.__dict__)
+        self.assertEqual(settings.SUBSECTION.LOG, 'new/data/log')
+    
+    def test_circular_references(self):
+        class Settings(BaseSettings):
+            ONE = '{TWO}'
+            TWO = '{SUBSECTION.THREE}'
+            class SUBSECTION(Section):
+                THREE = '{ONE}'
+        
+        self.assertRaises(basesettings.SettingsException, Settings)
+        
+        class Settings(BaseSettings):
+            ONE = 'one'
+            TWO = '{ONE}'
+        
+        settings = Settings()
+        settings.ONE = '{TWO}'
+        self.assertRaises(basesettings.SettingsException, getattr, settings, 'TWO')
+    
+    def test_references_threads(self):
+        class Settings(BaseSettings):
+            ONE = 'one'
+            TWO = '{ONE}/two'
+            THREE = '{TWO}/three'
+        
+        settings = Settings()
+        errors = []
+        def read():
+            try:
+                for i in range(500):
+                    self.assertEqual(settings.THREE, 'one/two/three')
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=read) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+    
+    def test_deep_references(self):
+        attrs = {'use_cache' : True, 'KEY0' : 'end'}
+        for i in range(1, 2000):
+            attrs['KEY%d' % i] = '{KEY%d}' % (i - 1)
+        Settings = type(BaseSettings)('Settings', (BaseSettings,), attrs)
+        
+        settings = Settings()
+        self.assertEqual(settings.KEY1999, 'end')
+        settings.KEY0 = 'changed'
+        self.assertEqual(settings.KEY1999, 'changed')
+        
+        # without caching the chain is resolved the same way
+        attrs = {'KEY0' : 'end'}
+        for i in range(1, 2000):
+            attrs['KEY%d' % i] = '{KEY%d}' % (i - 1)
+        Settings = type(BaseSettings)('Settings', (BaseSettings,), attrs)
+        settings = Settings()
+        self.assertEqual(settings.KEY1999, 'end')
+        settings.KEY0 = 'changed'
+        self.assertEqual(settings.KEY1999, 'changed')
+        self.assertTrue(settings._state.memo is None)